@@ -8,11 +8,16 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from bs4 import BeautifulSoup
-import pandas as pd
 import time
 
+from page_validation import ExtractionError, validate_page
+from parse_cache import ParseCache
+from row_buffer import RowBuffer
+
 URL = "https://web.archive.org/web/20250313165948/https://www.topjobs.lk/index.jsp"
 OUT = "topjobs_titles_all_pages2.csv"
+COLUMNS = ("jobref", "position", "company", "jobdesc_snippet",
+           "opening_date", "closing_date", "town")
 
 # --- Selenium setup ---
 opts = Options()
@@ -25,24 +30,34 @@ opts.add_argument("--window-size=1600,900")
 driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=opts)
 wait = WebDriverWait(driver, 20)
 
+# Parsed tables from earlier runs; editing this script invalidates them
+parse_cache = ParseCache(extractor="2026extract", sources=(__file__, "row_buffer.py"))
+
 
 def scrape_current_page():
     """Scrape all rows from the job table on the current page."""
     # Wait for table to be loaded
     wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "#jb-list table tr")))
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    html = driver.page_source
+    key = parse_cache.key(html)
+    cached = parse_cache.get(key)
+    if cached is not None:
+        print(f"Table unchanged since an earlier run: {len(cached)} rows from parse cache")
+        return cached
+
+    soup = BeautifulSoup(html, "html.parser")
     container = soup.select_one("#jb-list")
     if not container:
         print("WARNING: #jb-list not found on this page")
-        return []
+        return RowBuffer(COLUMNS)
 
     table = container.find("table")
     if not table:
         print("WARNING: job table not found under #jb-list")
-        return []
+        return RowBuffer(COLUMNS)
 
-    rows_data = []
+    rows_data = RowBuffer(COLUMNS)
     rows = table.find_all("tr")
 
     # Skip header row
@@ -63,16 +78,9 @@ def scrape_current_page():
         closing = tds[4].get_text(" ", strip=True) if len(tds) > 4 else ""
         town = tds[5].get_text(" ", strip=True) if len(tds) > 5 else ""
 
-        rows_data.append({
-            "jobref": jobref,
-            "position": position,
-            "company": company,
-            "jobdesc_snippet": jobdesc,
-            "opening_date": opening,
-            "closing_date": closing,
-            "town": town
-        })
+        rows_data.append(jobref, position, company, jobdesc, opening, closing, town)
 
+    parse_cache.put(key, rows_data)
     return rows_data
 
 
@@ -102,13 +110,19 @@ try:
     print("Opening first page:", URL)
     driver.get(URL)
 
-    all_rows = []
+    all_rows = RowBuffer(COLUMNS)
     page_num = 1
 
     while True:
         print(f"\nScraping page {page_num}...")
         page_rows = scrape_current_page()
         print(f"  Found {len(page_rows)} rows on this page.")
+
+        # This script only knows the jobref-first table; stop on page 1 if the
+        # site uses another layout (2025_new.py switches layouts instead)
+        problems = validate_page(page_rows)
+        if problems:
+            raise ExtractionError(f"Page {page_num}: " + "; ".join(problems))
         all_rows.extend(page_rows)
 
         # Try to go to next page
@@ -121,7 +135,7 @@ try:
         # Give time for next page to load
         time.sleep(2)
 
-    df = pd.DataFrame(all_rows)
+    df = all_rows.to_pandas()
     if not df.empty:
         # Just in case, drop duplicate jobrefs
         df = df.drop_duplicates(subset=["jobref"])
@@ -0,0 +1,157 @@
+# aggregates.py
+#
+# Materialized vacancy counts by month, company, town and row_type, kept in
+# SQLite and updated only for rows whose jobref has not been ingested before.
+# A refresh after a daily crawl therefore costs work proportional to the new
+# rows, not to the full 2019-2025 history.
+#
+# Usage:
+#   python aggregates.py ingest                        # every file in CORPUS_FILES
+#   python aggregates.py ingest topjobs_titles_all_pages_with_rowtypes.csv
+#   python aggregates.py series --dim company --key "MAS Intimates"
+#   python aggregates.py top --dim company --since 2024-01 -n 10
+
+import argparse
+import sqlite3
+
+from corpus import CORPUS_FILES, parse_date, parse_jobref, read_rows
+
+AGG_DB = "aggregates.sqlite"
+
+# Dimensions counted per month. "all" has a single key and gives the overall
+# monthly total.
+DIMENSIONS = ("all", "company", "town", "row_type")
+
+
+def open_db(path=AGG_DB):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS ingested (
+            jobref INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS counts (
+            dim   TEXT NOT NULL,
+            key   TEXT NOT NULL,
+            month TEXT NOT NULL,
+            n     INTEGER NOT NULL,
+            PRIMARY KEY (dim, key, month)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS counts_by_month ON counts (dim, month);
+        """
+    )
+    return conn
+
+
+def row_month(row):
+    """Month bucket ("2025-12") of a row, from its opening date."""
+    opened = parse_date(row.get("opening_date"))
+    return opened.strftime("%Y-%m") if opened else "unknown"
+
+
+def ingest_rows(conn, rows):
+    """
+    Add the counts of every row whose jobref has not been ingested yet.
+    Rows can come straight from scrape_current_page or from a CSV.
+    Returns the number of new rows counted.
+    """
+    deltas = {}
+    new = 0
+    with conn:
+        for row in rows:
+            jobref = parse_jobref(row.get("jobref"))
+            if jobref is None:
+                continue
+            cur = conn.execute("INSERT OR IGNORE INTO ingested (jobref) VALUES (?)", (jobref,))
+            if cur.rowcount == 0:
+                continue  # already counted
+            new += 1
+            month = row_month(row)
+            for dim in DIMENSIONS:
+                value = row.get(dim)
+                # pandas hands missing values over as NaN
+                key = "all" if dim == "all" else (value.strip() if isinstance(value, str) else "")
+                deltas[(dim, key, month)] = deltas.get((dim, key, month), 0) + 1
+
+        conn.executemany(
+            "INSERT INTO counts (dim, key, month, n) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (dim, key, month) DO UPDATE SET n = n + excluded.n",
+            [(dim, key, month, n) for (dim, key, month), n in deltas.items()],
+        )
+    return new
+
+
+def ingest_csv(conn, path):
+    return ingest_rows(conn, read_rows(path))
+
+
+# ---------------- Queries ----------------
+def time_series(conn, dim="all", key="all", since=None, until=None):
+    """[(month, count), ...] for one dimension value, oldest month first."""
+    sql = "SELECT month, n FROM counts WHERE dim = ? AND key = ?"
+    params = [dim, key]
+    if since:
+        sql += " AND month >= ?"
+        params.append(since)
+    if until:
+        sql += " AND month <= ?"
+        params.append(until)
+    return conn.execute(sql + " ORDER BY month", params).fetchall()
+
+
+def top_n(conn, dim, n=10, since=None, until=None):
+    """[(key, count), ...] for the n largest values of a dimension over a month range."""
+    sql = "SELECT key, SUM(n) AS total FROM counts WHERE dim = ? AND key != ''"
+    params = [dim]
+    if since:
+        sql += " AND month >= ?"
+        params.append(since)
+    if until:
+        sql += " AND month <= ?"
+        params.append(until)
+    sql += " GROUP BY key ORDER BY total DESC, key LIMIT ?"
+    params.append(n)
+    return conn.execute(sql, params).fetchall()
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Incremental vacancy count tables.")
+    parser.add_argument("--db", default=AGG_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="count new rows from CSVs")
+    ingest.add_argument("csv", nargs="*", help="default: every file in CORPUS_FILES")
+
+    series = sub.add_parser("series", help="monthly counts for one value")
+    series.add_argument("--dim", choices=DIMENSIONS, default="all")
+    series.add_argument("--key", default="all")
+    series.add_argument("--since")
+    series.add_argument("--until")
+
+    top = sub.add_parser("top", help="largest values of a dimension")
+    top.add_argument("--dim", choices=DIMENSIONS[1:], required=True)
+    top.add_argument("-n", type=int, default=10)
+    top.add_argument("--since")
+    top.add_argument("--until")
+
+    args = parser.parse_args()
+    conn = open_db(args.db)
+    try:
+        if args.command == "ingest":
+            paths = args.csv or [path for _, path in CORPUS_FILES]
+            for path in paths:
+                print(f"{path}: {ingest_csv(conn, path)} new rows counted")
+        elif args.command == "series":
+            for month, n in time_series(conn, args.dim, args.key, args.since, args.until):
+                print(f"  {month}  {n}")
+        else:
+            for key, n in top_n(conn, args.dim, args.n, args.since, args.until):
+                print(f"  {n:>6}  {key}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
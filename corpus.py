@@ -0,0 +1,47 @@
+# corpus.py
+#
+# The merged per-year CSVs that make up the full vacancy history, plus small
+# helpers shared by the indexing and analytics scripts.
+
+import csv
+from datetime import datetime
+
+# (year, path) for every merged file. The year is the crawl year; 2023.csv
+# also holds late-2022 vacancies that were still open when it was crawled.
+CORPUS_FILES = [
+    (2019, "2019_merged_final.csv"),
+    (2020, "2020_merged_final.csv"),
+    (2021, "2021_merged_final.csv"),
+    (2023, "2023 CSVs/2023.csv"),
+    (2024, "2024_merged.csv"),
+    (2025, "2025_merged.csv"),
+]
+
+# Columns produced by scrape_current_page (older files lack "page")
+COLUMNS = ["page", "row_no", "jobref", "position", "company", "jobdesc_snippet",
+           "opening_date", "closing_date", "town", "row_type"]
+
+# Listing pages show dates as "Mon Dec 01 2025"
+DATE_FORMAT = "%a %b %d %Y"
+
+
+def read_rows(path):
+    """Yield each row of a scraper/merge CSV as a dict."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def parse_jobref(value):
+    """Return the jobref as an int, or None when it is not a number."""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    """Parse a listing date ("Mon Dec 01 2025"); returns None when unparseable."""
+    try:
+        return datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except ValueError:
+        return None
@@ -0,0 +1,429 @@
+# crawl_daemon.py
+#
+# Long-running crawl service. Instead of paying browser/driver startup,
+# connection setup and imports on every one-shot script run, one resident
+# process schedules the crawls and keeps its resources warm between runs:
+#
+#   - FetchController (fetch_control.py): per-host adaptive concurrency and
+#     kept-alive connections
+#   - the listing parser (listing_parse.py); rows stay in RowBuffers, so
+#     pandas is never imported
+#   - open SQLite connection for the aggregate tables (aggregates.py)
+#   - the seen/all jobref bitmap (jobref_bitmap.py), so each run reports how
+#     many jobrefs were never seen before
+#
+# Jobs:
+#   live     every listing page of topjobs.lk, every LIVE_INTERVAL seconds
+#   wayback  one archived snapshot (all pageNo values) per run, lower priority;
+#            a snapshot that fails SNAPSHOT_ATTEMPTS runs is logged to
+#            BACKFILL_FAILED and skipped
+#
+# Each run writes the same rows scrape_current_page produces (same parser,
+# same columns) to OUT_DIR/<job>_<timestamp>.csv.
+#
+# Status: GET http://127.0.0.1:8765/status returns queue depth, running jobs,
+# last-run stats per job and per-host fetch stats as JSON.
+#
+# Usage:
+#   python crawl_daemon.py
+#   python crawl_daemon.py --wayback 20220520233919 20230326214532 --live-interval 1800
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aggregates
+import search_index
+import warehouse
+from fetch_control import CircuitOpenError, FetchController, FetchError
+from jobref_bitmap import SEEN, JobrefBitmap, bitmap_path, load_named, save_named
+from listing_parse import DEFAULT_LAYOUT, parse_validated
+from listing_urls import LIVE_URL, WAYBACK_URL, wayback_time
+from parse_cache import ParseCache
+from page_validation import ExtractionError
+from row_buffer import COLUMNS, RowBuffer
+
+OUT_DIR = "daemon_output"
+BACKFILL_STATE = "daemon_backfill_done.txt"
+BACKFILL_FAILED = "daemon_backfill_failed.txt"
+SNAPSHOT_ATTEMPTS = 3       # failed runs before a Wayback snapshot is given up on
+
+STATUS_HOST = "127.0.0.1"
+STATUS_PORT = 8765
+
+WORKERS = 2                 # jobs that may run at the same time
+PAGE_BATCH = 4              # listing pages fetched concurrently within a job
+MAX_PAGES = 50              # same safety limit as 2025_new.py
+LIVE_INTERVAL = 3600        # seconds
+WAYBACK_INTERVAL = 600
+JITTER = 0.2                # +/- fraction of the interval
+
+# Lower runs first when several jobs are due
+LIVE_PRIORITY = 0
+WAYBACK_PRIORITY = 10
+
+
+# ---------------- Jobs ----------------
+class CrawlJob:
+    """A periodic crawl. Subclasses provide the page URLs for one run."""
+
+    kind = "crawl"
+
+    def __init__(self, name, interval, priority):
+        self.name = name
+        self.interval = interval
+        self.priority = priority
+        self.runs = 0
+        self.last_run = None
+        self.next_run = None
+        # Table layout whose rows last passed validation
+        self.layout = DEFAULT_LAYOUT
+
+    def page_url(self, page):
+        raise NotImplementedError
+
+    def has_work(self):
+        return True
+
+    def finish(self):
+        """Called after a successful run."""
+
+    def fail(self, error):
+        """Called after a failed run."""
+
+    def scraped_at(self):
+        """When the pages of this run were captured; None means now."""
+        return None
+
+    def label(self):
+        return self.name
+
+
+class LiveCrawl(CrawlJob):
+    kind = "live"
+
+    def page_url(self, page):
+        return LIVE_URL.format(page=page)
+
+
+class WaybackBackfill(CrawlJob):
+    """
+    Works through a list of Wayback timestamps, one snapshot per run. A
+    snapshot that fails goes to the back of the list; after
+    SNAPSHOT_ATTEMPTS failures it is written to failed_path and dropped.
+    """
+
+    kind = "wayback"
+
+    def __init__(self, name, interval, priority, timestamps, state_path=BACKFILL_STATE,
+                 failed_path=BACKFILL_FAILED):
+        super().__init__(name, interval, priority)
+        self.state_path = state_path
+        self.failed_path = failed_path
+        done = set()
+        for path in (state_path, failed_path):
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    done.update(line.split("\t")[0].strip() for line in f if line.strip())
+        self.pending = [ts for ts in timestamps if ts not in done]
+        self.attempts = {}
+
+    def has_work(self):
+        return bool(self.pending)
+
+    def page_url(self, page):
+        return WAYBACK_URL.format(timestamp=self.pending[0], page=page)
+
+    def label(self):
+        return f"{self.name}_{self.pending[0]}"
+
+    def scraped_at(self):
+        return wayback_time(self.pending[0])
+
+    def finish(self):
+        with open(self.state_path, "a", encoding="utf-8") as f:
+            f.write(self.pending.pop(0) + "\n")
+
+    def fail(self, error):
+        ts = self.pending.pop(0)
+        self.attempts[ts] = self.attempts.get(ts, 0) + 1
+        if self.attempts[ts] < SNAPSHOT_ATTEMPTS:
+            self.pending.append(ts)
+            return
+        print(f"[{self.name}] giving up on snapshot {ts} after {self.attempts[ts]} attempts")
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            f.write(f"{ts}\t{' '.join(error.split())}\n")
+
+
+# ---------------- Daemon ----------------
+class CrawlDaemon:
+    def __init__(self, jobs, out_dir=OUT_DIR, workers=WORKERS):
+        self.jobs = jobs
+        self.out_dir = out_dir
+        self.workers = workers
+        self.controller = FetchController()
+        # Unchanged live pages and repeated Wayback content skip the parse
+        self.parse_cache = ParseCache()
+        # Long-lived fetch threads: kept-alive connections belong to the
+        # thread that opened them, so they survive from one run to the next
+        self.page_pool = ThreadPoolExecutor(max_workers=PAGE_BATCH * workers)
+        self.started = time.time()
+        self.stop = threading.Event()
+
+        self.schedule = []              # heap of (due, seq, job)
+        self.ready = queue.PriorityQueue()  # (priority, seq, job) due and waiting
+        self.running = {}
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        # The search index is loaded, extended and saved as one file
+        self.index_lock = threading.Lock()
+        self.local = threading.local()
+        # Every jobref recorded so far, kept in memory for membership tests
+        self.seen = load_named(SEEN) if os.path.exists(bitmap_path(SEEN)) else JobrefBitmap()
+
+        now = time.time()
+        for job in jobs:
+            self._schedule(job, now)
+
+    # ---------------- Scheduling ----------------
+    def _schedule(self, job, when):
+        job.next_run = when
+        with self.lock:
+            heapq.heappush(self.schedule, (when, next(self.seq), job))
+
+    def _reschedule(self, job):
+        delay = job.interval * random.uniform(1 - JITTER, 1 + JITTER)
+        self._schedule(job, time.time() + delay)
+
+    def _scheduler_loop(self):
+        """Move due jobs onto the ready queue."""
+        while not self.stop.is_set():
+            with self.lock:
+                due = []
+                while self.schedule and self.schedule[0][0] <= time.time():
+                    due.append(heapq.heappop(self.schedule)[2])
+                wait = self.schedule[0][0] - time.time() if self.schedule else 1.0
+            for job in due:
+                self.ready.put((job.priority, next(self.seq), job))
+            self.stop.wait(min(max(wait, 0.05), 1.0))
+
+    def _worker_loop(self):
+        while not self.stop.is_set():
+            try:
+                _, _, job = self.ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if job.has_work():
+                self.run_job(job)
+            self._reschedule(job)
+
+    # ---------------- Crawling ----------------
+    def _agg_conn(self):
+        """This worker's aggregate-table connection, opened once and kept."""
+        conn = getattr(self.local, "agg_conn", None)
+        if conn is None:
+            conn = self.local.agg_conn = aggregates.open_db()
+        return conn
+
+    def _warehouse_conn(self):
+        """This worker's listing-warehouse connection, opened once and kept."""
+        conn = getattr(self.local, "warehouse_conn", None)
+        if conn is None:
+            conn = self.local.warehouse_conn = warehouse.open_db()
+        return conn
+
+    def _fetch_page(self, job, page):
+        status, html = self.controller.fetch(job.page_url(page))
+        if status != 200:
+            return RowBuffer()
+        rows, job.layout = parse_validated(html, page, job.layout, self.parse_cache)
+        return rows
+
+    def crawl(self, job):
+        """Fetch listing pages in batches until one comes back empty."""
+        all_rows = RowBuffer()
+        page = 1
+        while page <= MAX_PAGES and not self.stop.is_set():
+            batch = range(page, min(page + PAGE_BATCH, MAX_PAGES + 1))
+            results = list(self.page_pool.map(lambda p: self._fetch_page(job, p), batch))
+            for page_rows in results:
+                if not page_rows:
+                    return all_rows
+                all_rows.extend(page_rows)
+            page = batch[-1] + 1
+        return all_rows
+
+    def run_job(self, job):
+        label = job.label()
+        started = time.time()
+        with self.lock:
+            self.running[job.name] = label
+        stats = {"label": label, "started": datetime.fromtimestamp(started).isoformat(timespec="seconds")}
+        try:
+            rows = self.crawl(job)
+            out, written = self.write_rows(label, rows)
+            new = aggregates.ingest_rows(self._agg_conn(), rows)
+            # Backfills carry their snapshot time so they never overwrite newer listings
+            warehouse.upsert_rows(self._warehouse_conn(), rows, source=label, seen=job.scraped_at())
+            never_seen = self.record_jobrefs(label, rows.column("jobref"))
+            with self.index_lock:
+                search_index.add_to_index(rows, int((job.scraped_at() or datetime.now().isoformat())[:4]))
+            job.finish()
+            stats.update(ok=True, rows=len(rows), unique_rows=written, new_rows=new,
+                         never_seen=never_seen, output=out)
+            print(f"[{label}] {written} rows -> {out} ({never_seen} jobrefs never seen before)")
+        except (FetchError, CircuitOpenError, ExtractionError, OSError) as e:
+            stats.update(ok=False, error=str(e))
+            print(f"[{label}] failed: {e}")
+            job.fail(str(e))
+        except Exception as e:
+            stats.update(ok=False, error=repr(e))
+            traceback.print_exc()
+            job.fail(repr(e))
+        finally:
+            stats["seconds"] = round(time.time() - started, 2)
+            with self.lock:
+                self.running.pop(job.name, None)
+                job.runs += 1
+                job.last_run = stats
+
+    def record_jobrefs(self, label, jobrefs):
+        """
+        Save this run as a snapshot bitmap and fold it into seen/all.
+        Returns how many of its jobrefs had never been recorded before.
+        """
+        snapshot = JobrefBitmap(j for j in jobrefs if j is not None)
+        with self.lock:
+            # merge.py folds its merges into seen/all as well: start from the
+            # file so saving our copy does not drop them
+            if os.path.exists(bitmap_path(SEEN)):
+                self.seen = self.seen | load_named(SEEN)
+            never_seen = len(snapshot - self.seen)
+            self.seen = self.seen | snapshot
+            save_named(SEEN, self.seen)
+        save_named(f"snapshot/{label}_{datetime.now():%Y%m%dT%H%M%S}", snapshot)
+        return never_seen
+
+    def write_rows(self, label, rows):
+        """Write rows de-duplicated by jobref (keeping the first), like 2025_new.py."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        out = os.path.join(self.out_dir, f"{label}_{datetime.now():%Y%m%dT%H%M%S}.csv")
+        seen = set()
+        written = 0
+        with open(out, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for row in rows:
+                if row["jobref"] in seen:
+                    continue
+                seen.add(row["jobref"])
+                writer.writerow(["" if row[c] is None else row[c] for c in COLUMNS])
+                written += 1
+        return out, written
+
+    # ---------------- Status ----------------
+    def status(self):
+        now = time.time()
+        with self.lock:
+            jobs = [{
+                "name": job.name,
+                "kind": job.kind,
+                "priority": job.priority,
+                "has_work": job.has_work(),
+                "next_run_in": round(job.next_run - now, 1) if job.next_run else None,
+                "runs": job.runs,
+                "last_run": job.last_run,
+            } for job in self.jobs]
+            running = dict(self.running)
+        return {
+            "uptime": round(now - self.started, 1),
+            "queue_depth": self.ready.qsize(),
+            "running": running,
+            "jobs": jobs,
+            "hosts": self.controller.stats(),
+        }
+
+    def serve_status(self, host=STATUS_HOST, port=STATUS_PORT):
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(daemon.status(), indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), StatusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Status endpoint: http://{host}:{server.server_address[1]}/status")
+        return server
+
+    def run(self, status_port=STATUS_PORT):
+        server = self.serve_status(port=status_port)
+        threads = [threading.Thread(target=self._scheduler_loop, daemon=True)]
+        threads += [threading.Thread(target=self._worker_loop, daemon=True) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        try:
+            while not self.stop.is_set():
+                self.stop.wait(1.0)
+        finally:
+            self.stop.set()
+            for t in threads:
+                t.join(timeout=30)
+            self.page_pool.shutdown(wait=False)
+            server.shutdown()
+            print("Daemon stopped.")
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Resident topjobs crawl service.")
+    parser.add_argument("--live-interval", type=float, default=LIVE_INTERVAL)
+    parser.add_argument("--no-live", action="store_true", help="only run Wayback backfills")
+    parser.add_argument("--wayback", nargs="*", default=[], metavar="TIMESTAMP",
+                        help="Wayback timestamps to backfill, e.g. 20230326214532")
+    parser.add_argument("--wayback-interval", type=float, default=WAYBACK_INTERVAL)
+    parser.add_argument("--out-dir", default=OUT_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--status-port", type=int, default=STATUS_PORT)
+    args = parser.parse_args()
+
+    jobs = []
+    if not args.no_live:
+        jobs.append(LiveCrawl("live", args.live_interval, LIVE_PRIORITY))
+    if args.wayback:
+        jobs.append(WaybackBackfill("wayback", args.wayback_interval, WAYBACK_PRIORITY, args.wayback))
+    if not jobs:
+        parser.error("nothing to do: live crawl disabled and no --wayback timestamps")
+
+    daemon = CrawlDaemon(jobs, args.out_dir, args.workers)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop.set())
+    try:
+        daemon.run(args.status_port)
+    except KeyboardInterrupt:
+        daemon.stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,12 +9,16 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from bs4 import BeautifulSoup
-import pandas as pd
 import time
 
+from parse_cache import ParseCache
+from row_buffer import RowBuffer
+
 URL = ("https://web.archive.org/web/20230326214532/https://topjobs.lk/applicant/vacancybyfunctionalarea.jsp?FA=&jst=OPEN&sQut=&txtKeyWord=&chkGovt=&chkParttime=&chkWalkin=&chkNGO=&pageNo=1")
 
 OUT = "2023p1.csv"
+COLUMNS = ("row_no", "jobref", "position", "company", "jobdesc_snippet",
+           "opening_date", "closing_date", "town")
 
 # ---------------- Selenium setup ----------------
 opts = Options()
@@ -29,6 +33,9 @@ driver = webdriver.Chrome(
 )
 wait = WebDriverWait(driver, 20)
 
+# Parsed tables from earlier runs; editing this script invalidates them
+parse_cache = ParseCache(extractor="extract3", sources=(__file__, "row_buffer.py"))
+
 
 # ---------------- Helpers ----------------
 def find_job_table(soup):
@@ -76,16 +83,23 @@ def scrape_page(debug_first_n=5):
         )
     )
 
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    html = driver.page_source
+    key = parse_cache.key(html)
+    cached = parse_cache.get(key)
+    if cached is not None:
+        print(f"Table unchanged since an earlier run: {len(cached)} rows from parse cache")
+        return cached
+
+    soup = BeautifulSoup(html, "html.parser")
     table = find_job_table(soup)
     if not table:
         print("ERROR: Job table not found.")
-        return []
+        return RowBuffer(COLUMNS)
 
     rows = table.find_all("tr")
     print("Total <tr> rows in table (including header):", len(rows))
 
-    rows_data = []
+    rows_data = RowBuffer(COLUMNS)
 
     for idx, tr in enumerate(rows[1:], start=1):  # skip header
         tds = tr.find_all("td")
@@ -117,17 +131,9 @@ def scrape_page(debug_first_n=5):
         closing = tds[5].get_text(" ", strip=True) if len(tds) > 5 else ""
         town    = tds[6].get_text(" ", strip=True) if len(tds) > 6 else ""
 
-        rows_data.append({
-            "row_no": row_no,
-            "jobref": jobref,
-            "position": position,
-            "company": company,
-            "jobdesc_snippet": jobdesc,
-            "opening_date": opening,
-            "closing_date": closing,
-            "town": town
-        })
+        rows_data.append(row_no, jobref, position, company, jobdesc, opening, closing, town)
 
+    parse_cache.put(key, rows_data)
     return rows_data
 
 
@@ -140,7 +146,7 @@ try:
     data_rows = scrape_page()
     print(f"\nScraped {len(data_rows)} rows.")
 
-    df = pd.DataFrame(data_rows)
+    df = data_rows.to_pandas()
     df.to_csv(OUT, index=False, encoding="utf-8-sig")
     print(f"Saved to {OUT}")
     if not df.empty:
@@ -7,13 +7,16 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-import pandas as pd
 import time
 import os
 
+from row_buffer import RowBuffer
+
 URL = ("https://web.archive.org/web/20220520233919/https://topjobs.lk/applicant/vacancybyfunctionalarea.jsp?FA=&jst=OPEN&sQut=&txtKeyWord=&chkGovt=&chkParttime=&chkWalkin=&chkNGO=&pageNo=4")
 
 OUT = "2022---p1.csv"
+COLUMNS = ("row_no", "jobref", "position", "company", "jobdesc_snippet",
+           "opening_date", "closing_date", "town", "row_type")
 
 # ---------------- Selenium setup ----------------
 opts = Options()
@@ -72,7 +75,7 @@ def extract_position_and_company(position_cell):
 
 def extract_row_data(row_element, row_idx):
     """
-    Extract data from a single row
+    Extract data from a single row as a tuple in COLUMNS order
     """
     try:
         cells = row_element.find_elements(By.TAG_NAME, "td")
@@ -108,20 +111,8 @@ def extract_row_data(row_element, row_idx):
             closing = cells[5].text.strip() if len(cells) > 5 else ""
             town = cells[6].text.strip() if len(cells) > 6 else ""
 
-        row_data = {
-            "row_no": row_no,
-            "jobref": jobref,
-            "position": position,
-            "company": company,
-            "jobdesc_snippet": jobdesc,
-            "opening_date": opening,
-            "closing_date": closing,
-            "town": town,
-            "row_type": row_type
-        }
-        
         print(f"Row {row_idx}: {row_type} - '{position[:30]}...' at '{company[:20]}...'")
-        return row_data
+        return (row_no, jobref, position, company, jobdesc, opening, closing, town, row_type)
         
     except Exception as e:
         print(f"Error extracting row {row_idx}: {e}")
@@ -138,7 +129,7 @@ def scrape_page():
     
     print(f"Total rows found: {len(rows)}")
     
-    rows_data = []
+    rows_data = RowBuffer(COLUMNS)
     successful_rows = 0
     
     # Skip header row (index 0)
@@ -147,7 +138,7 @@ def scrape_page():
             break
         row_data = extract_row_data(row, idx)
         if row_data:
-            rows_data.append(row_data)
+            rows_data.append(*row_data)
             successful_rows += 1
     
     print(f"Successfully extracted {successful_rows} out of {min(20000, len(rows)-1)} rows")
@@ -164,7 +155,7 @@ try:
     data_rows = scrape_page()
     
     if data_rows:
-        df = pd.DataFrame(data_rows)
+        df = data_rows.to_pandas()
         df.to_csv(OUT, index=False, encoding="utf-8-sig")
         print(f"Saved {len(data_rows)} rows to {OUT}")
         
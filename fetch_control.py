@@ -0,0 +1,484 @@
+# fetch_control.py
+#
+# Adaptive concurrency for HTTP fetches against topjobs.lk and the Wayback
+# Machine. Each host gets its own controller state:
+#
+#   - AIMD concurrency limit: +1 per good response until the first congestion
+#     event (slow start), +1/limit after that; halved (at most once per
+#     latency window) on 429/5xx/timeouts, or when the server is queueing:
+#     recent latency well above both its long-run average and the recent
+#     minimum while the number of requests in flight is rising too (latency
+#     that merely varies, as Wayback's does, is not congestion); capped at
+#     max_limit so a polite caller can stay well under what the server would
+#     tolerate
+#   - jittered exponential backoff between retries, honouring Retry-After
+#   - circuit breaker: after FAILURE_THRESHOLD consecutive failures the host is
+#     paused for a cooldown, then a single probe request decides whether to
+#     close it again
+#
+# A throttled host slows down only the requests to that host; everything else
+# keeps going. Each worker thread keeps its connections alive between
+# requests, so a long-running process pays DNS/TCP/TLS setup once per host.
+#
+# Usage:
+#   from fetch_control import FetchController
+#   controller = FetchController()
+#   status, body = controller.fetch(url)
+#
+#   python fetch_control.py simulate     # local throttling and variable-latency server checks
+
+import argparse
+import http.client
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+}
+
+MIN_LIMIT = 1
+MAX_LIMIT = 32
+INITIAL_LIMIT = 4
+DECREASE_FACTOR = 0.5
+LATENCY_FACTOR = 3.0        # recent latency this many times the recent minimum can be queueing...
+LATENCY_GRADIENT = 1.5      # ...if it is also this many times the long-run average
+SHORT_ALPHA = 0.2           # EWMA weights of the newest sample: recent latency / load
+LONG_ALPHA = 0.02           # long-run latency / load
+MIN_LATENCY_WINDOW = 30.0   # seconds; the minimum latency is taken over the last one or two windows
+
+BACKOFF_BASE = 1.0          # seconds
+BACKOFF_CAP = 60.0
+MAX_ATTEMPTS = 5
+TIMEOUT = 30
+
+FAILURE_THRESHOLD = 5       # congestion events without a success that open the circuit
+COOLDOWN = 30.0             # seconds the circuit stays open before a probe
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Final answers: returned to the caller without retrying
+OK_STATUSES = range(200, 400)
+FINAL_STATUSES = (404, 410)
+# Server asking us to slow down
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """The host's circuit breaker is open and stayed open for the whole wait."""
+
+
+class FetchError(Exception):
+    """Every attempt at a URL failed."""
+
+
+class HostState:
+    """Concurrency limit, in-flight count and breaker state for one host."""
+
+    def __init__(self, host, initial_limit=INITIAL_LIMIT, max_limit=MAX_LIMIT):
+        self.host = host
+        self.max_limit = float(max_limit)
+        self.limit = float(min(initial_limit, max_limit))
+        self.slow_start_until = max_limit
+        self.in_flight = 0
+        # Successful responses: minimum latency of the current and previous
+        # MIN_LATENCY_WINDOW (so it can rise again when the route gets
+        # slower), short/long EWMAs of latency and of requests in flight
+        self.best_latency = None
+        self.window_min = None
+        self.window_started = time.monotonic()
+        self.previous_min = None
+        self.short_latency = self.long_latency = None
+        self.short_load = self.long_load = None
+        self.last_decrease = 0.0
+        self.failures = 0
+        self.opened_at = None       # circuit open since (monotonic), None when closed
+        self.probing = False
+        self.cond = threading.Condition()
+        # Stats for status reporting
+        self.requests = 0
+        self.throttled = 0
+
+    # ---------------- Admission ----------------
+    def acquire(self, timeout=None):
+        """Block until a request may start. Raises CircuitOpenError on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.opened_at is None:
+                    if self.in_flight < int(self.limit):
+                        break
+                    wait = None
+                else:
+                    remaining = self.opened_at + COOLDOWN - now
+                    if remaining <= 0 and not self.probing:
+                        # Half-open: let exactly one probe through
+                        self.probing = True
+                        break
+                    wait = max(remaining, 0.5)
+
+                if deadline is not None:
+                    left = deadline - now
+                    if left <= 0:
+                        raise CircuitOpenError(f"{self.host}: circuit open")
+                    wait = left if wait is None else min(wait, left)
+                self.cond.wait(wait)
+            self.in_flight += 1
+            self.requests += 1
+
+    def release(self, latency, ok, throttled):
+        """Record the outcome of a request and adjust the limit."""
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if ok:
+                queueing = self._record_latency(now, latency, self.in_flight + 1)
+                # Any served response proves the host is up, slow or not
+                self.failures = 0
+                self.opened_at = None
+                if queueing:
+                    # Served, but the server is queueing: treat as congestion
+                    self._decrease(now, latency)
+                else:
+                    step = 1.0 if self.limit < self.slow_start_until else 1.0 / self.limit
+                    self.limit = min(self.max_limit, self.limit + step)
+            elif throttled:
+                self.throttled += 1
+                # Failures of requests already in flight when the limit was
+                # cut count as the same event
+                if self._decrease(now, latency) or self.probing:
+                    self.failures += 1
+                if self.failures >= FAILURE_THRESHOLD or self.probing:
+                    if self.opened_at is None:
+                        print(f"  {self.host}: circuit open for {COOLDOWN:.0f}s "
+                              f"after {self.failures} failures")
+                    self.opened_at = now
+            # else: refused outright (403, a redirect loop, ...), which says
+            # nothing about load, so the limit stays where it is
+            self.probing = False
+            self.cond.notify_all()
+
+    def _record_latency(self, now, latency, load):
+        """Fold in a successful response; returns True if latency and load are rising together."""
+        if now - self.window_started > MIN_LATENCY_WINDOW:
+            self.previous_min, self.window_min = self.window_min, None
+            self.window_started = now
+        if self.window_min is None or latency < self.window_min:
+            self.window_min = latency
+        self.best_latency = min(m for m in (self.window_min, self.previous_min) if m is not None)
+
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            self.short_load = self.long_load = load
+            return False
+        self.short_latency += SHORT_ALPHA * (latency - self.short_latency)
+        self.long_latency += LONG_ALPHA * (latency - self.long_latency)
+        self.short_load += SHORT_ALPHA * (load - self.short_load)
+        self.long_load += LONG_ALPHA * (load - self.long_load)
+        return (self.short_latency > self.best_latency * LATENCY_FACTOR
+                and self.short_latency > self.long_latency * LATENCY_GRADIENT
+                and self.short_load > self.long_load)
+
+    def _decrease(self, now, latency):
+        # At most one decrease per latency window, so a burst of errors from
+        # requests that were already in flight counts as one congestion event
+        window = max(self.best_latency or latency, 0.05)
+        if now - self.last_decrease < window:
+            return False
+        self.limit = max(MIN_LIMIT, self.limit * DECREASE_FACTOR)
+        self.slow_start_until = self.limit
+        self.last_decrease = now
+        return True
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                "host": self.host,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "circuit": "closed" if self.opened_at is None else "open",
+            }
+
+
+class FetchController:
+    """Shared by all fetching threads; keeps one HostState per host."""
+
+    def __init__(self, initial_limit=INITIAL_LIMIT, max_attempts=MAX_ATTEMPTS,
+                 timeout=TIMEOUT, backoff_base=BACKOFF_BASE, max_limit=MAX_LIMIT):
+        self.initial_limit = initial_limit
+        self.max_limit = float(max_limit)
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.hosts = {}
+        self.lock = threading.Lock()
+        # Keep-alive connections are per thread (http.client is not thread-safe)
+        self.local = threading.local()
+        self.ssl_context = ssl.create_default_context()
+
+    def host_state(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostState(host, self.initial_limit, self.max_limit)
+            return state
+
+    # ---------------- Connections ----------------
+    def _connection(self, scheme, netloc):
+        """This thread's kept-alive connection to a host (created on first use)."""
+        conns = getattr(self.local, "conns", None)
+        if conns is None:
+            conns = self.local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout,
+                                                   context=self.ssl_context)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self.local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _get(self, url, headers):
+        """
+        GET over this thread's connection to the host, following redirects
+        (Wayback answers most snapshot URLs with a 302 to the nearest capture).
+        Returns (status, headers, body_bytes).
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            conn = self._connection(parts.scheme, parts.netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if not reused:
+                    raise
+                # The server closed an idle kept-alive connection: retry once fresh
+                conn = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request("GET", path, headers=headers)
+                    resp = conn.getresponse()
+                    body = resp.read()
+                except (http.client.HTTPException, OSError):
+                    self._drop_connection(parts.scheme, parts.netloc)
+                    raise
+
+            location = resp.getheader("Location")
+            if resp.status in REDIRECT_STATUSES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return resp.status, resp.headers, body
+        raise FetchError(f"{url}: more than {MAX_REDIRECTS} redirects")
+
+    # ---------------- Fetching ----------------
+    def fetch(self, url, headers=None, breaker_wait=None):
+        """
+        GET a URL through the host's controller, retrying throttled and failed
+        attempts with jittered exponential backoff.
+
+        Returns (status, body_text); 404/410 come back as a normal status with
+        an empty body. Raises FetchError when every attempt fails and
+        CircuitOpenError if the host's breaker stays open for breaker_wait
+        seconds (default: wait as long as it takes).
+        """
+        state = self.host_state(url)
+        headers = headers or HEADERS
+        last_error = None
+        for attempt in range(self.max_attempts):
+            state.acquire(breaker_wait)
+            started = time.monotonic()
+            retry_after = None
+            status = None
+            # Anything escaping _get other than a network error (a redirect
+            # loop) is released as a refusal, not as congestion
+            ok = throttled = False
+            try:
+                status, resp_headers, body = self._get(url, headers)
+                ok = status in OK_STATUSES or status in FINAL_STATUSES
+                throttled = status in THROTTLE_STATUSES
+            except (http.client.HTTPException, OSError) as e:
+                # Timeouts, resets and refused connections
+                throttled = True
+                last_error = e
+            finally:
+                state.release(time.monotonic() - started, ok=ok, throttled=throttled)
+
+            if status in OK_STATUSES:
+                return status, decode_body(body, resp_headers)
+            if status in FINAL_STATUSES:
+                return status, ""
+            if status is not None:
+                if not throttled:
+                    raise FetchError(f"{url}: HTTP {status}")
+                retry_after = parse_retry_after(resp_headers.get("Retry-After"))
+                last_error = f"HTTP {status}"
+
+            if attempt + 1 < self.max_attempts:
+                time.sleep(max(backoff_delay(attempt, self.backoff_base), retry_after or 0))
+        raise FetchError(f"{url}: gave up after {self.max_attempts} attempts ({last_error})")
+
+    def stats(self):
+        with self.lock:
+            states = list(self.hosts.values())
+        return [s.snapshot() for s in states]
+
+
+def decode_body(body, headers):
+    """Body text in the charset the server declared, utf-8 when it names none we know."""
+    charset = headers.get_content_charset() or "utf-8"
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (only the delta-seconds form)."""
+    try:
+        return min(float(value), BACKOFF_CAP)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------- Throttling simulation ----------------
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in server with a fixed capacity: up to `capacity` concurrent
+    requests are served in `service_time` (uniform up to `max_service_time`
+    when that is set), anything beyond gets a 429.
+    """
+
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real servers
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    capacity = 6
+    service_time = 0.05
+    max_service_time = None
+    active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            over = cls.active >= cls.capacity
+            if not over:
+                cls.active += 1
+        if over:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            time.sleep(random.uniform(cls.service_time, cls.max_service_time or cls.service_time))
+            body = b"<html><body>ok</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def run_simulation(requests_total, capacity, workers, service_time, max_service_time=None):
+    """
+    Fetch requests_total URLs with `workers` threads from a local ThrottlingHandler.
+    Returns (statuses, seconds, host stats).
+    """
+    ThrottlingHandler.capacity = capacity
+    ThrottlingHandler.service_time = service_time
+    ThrottlingHandler.max_service_time = max_service_time
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler, bind_and_activate=False)
+    # The default listen backlog of 5 adds 1s SYN retries that would look like throttling
+    server.request_queue_size = 128
+    server.server_bind()
+    server.server_activate()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/vacancy?jc="
+
+    # Short backoff keeps the demo quick
+    controller = FetchController(backoff_base=0.05, max_attempts=8)
+
+    def fetch_status(i):
+        try:
+            return controller.fetch(url + str(i))[0]
+        except FetchError as e:
+            print(f"  {e}")
+            return None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fetch_status, range(requests_total)))
+    elapsed = time.monotonic() - started
+    server.shutdown()
+    server.server_close()
+    return results, elapsed, controller.stats()[0]
+
+
+def simulate(requests_total=400, capacity=6, workers=32):
+    """
+    Two checks against a local server:
+      - throttling: `capacity` concurrent requests, 429 beyond; every fetch
+        must still succeed
+      - variable latency: 50-200 ms responses, never throttled; the limit
+        must not collapse just because some responses are slower than others
+    """
+    results, elapsed, stats = run_simulation(requests_total, capacity, workers, 0.05)
+    ideal = capacity / 0.05
+    print(f"throttling: {results.count(200)}/{requests_total} OK in {elapsed:.2f}s "
+          f"({requests_total / elapsed:.0f} req/s, server limit ~{ideal:.0f} req/s)")
+    print(f"  {stats}")
+    assert results.count(200) == requests_total, "throttled fetches were not all retried to success"
+
+    n = requests_total * 4
+    results, elapsed, stats = run_simulation(n, n, workers, 0.05, 0.2)
+    ideal = workers / 0.125
+    print(f"variable latency: {results.count(200)}/{n} OK in {elapsed:.2f}s "
+          f"({n / elapsed:.0f} req/s, ~{ideal:.0f} req/s with {workers} workers)")
+    print(f"  {stats}")
+    assert results.count(200) == n
+    assert stats["limit"] >= min(workers, MAX_LIMIT) / 2, "limit collapsed on latency spread alone"
+    assert n / elapsed >= ideal / 3, "variable latency throttled throughput"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive fetch controller.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sim = sub.add_parser("simulate", help="fetch from a local throttling server")
+    sim.add_argument("-n", type=int, default=400)
+    sim.add_argument("--capacity", type=int, default=6)
+    sim.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    simulate(args.n, args.capacity, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# fetch_details.py
+#
+# Detail-fetch stage: take the jobrefs from a listing CSV produced by
+# scrape_current_page (2025_new.py) or merge.py, fetch every vacancy page
+# concurrently through the adaptive FetchController (fetch_control.py), cache
+# the content by jobref and join it back onto the listing rows.
+#
+# Usage:
+#   python fetch_details.py 2025_merged.csv
+#   python fetch_details.py 2025_merged.csv --url-template "http://127.0.0.1:8000/vacancy?jc={jc}"
+
+import argparse
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bs4 import BeautifulSoup
+import pandas as pd
+
+from fetch_control import CircuitOpenError, FetchController, FetchError
+from listing_parse import DEFAULT_CODE, hidden_span
+
+# jc is the jobref zero-padded to 10 digits; jc, ac and ec are the three codes
+# of the listing's hidden span ("0001439616 DEFZZZ DEFZZZ", or with real
+# codes "0001436547 0000000661 0000000492"), taken from the listing rows.
+DETAIL_URL = "https://www.topjobs.lk/employer/JobAdvertismentServlet?jc={jc}&ac={ac}&ec={ec}"
+CACHE_DB = "detail_cache.sqlite"
+
+MAX_WORKERS = 32        # upper bound on concurrent requests
+MAX_PER_HOST = 6        # cap on the controller's per-host limit: stay polite even when topjobs.lk keeps up
+BREAKER_WAIT = 300      # give up on a jobref (until the next run) after this long with the host paused
+
+# Status codes that are a final answer for a jobref; anything else is retried
+# on the next run.
+FINAL_STATUSES = (200, 404, 410)
+
+
+# ---------------- Cache ----------------
+def open_cache(path=CACHE_DB):
+    """
+    Open (or create) the detail cache. One row per jobref, HTML stored
+    zlib-compressed together with the extracted plain text.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS details (
+            jobref      INTEGER PRIMARY KEY,
+            status      INTEGER NOT NULL,
+            fetched_at  REAL NOT NULL,
+            html        BLOB,
+            detail_text TEXT
+        )
+        """
+    )
+    return conn
+
+
+def cached_jobrefs(conn):
+    """Return the set of jobrefs that already have a final answer in the cache."""
+    placeholders = ",".join("?" * len(FINAL_STATUSES))
+    cur = conn.execute(
+        f"SELECT jobref FROM details WHERE status IN ({placeholders})", FINAL_STATUSES
+    )
+    return {r[0] for r in cur}
+
+
+def store_detail(conn, jobref, status, html, text):
+    """Insert or replace one fetched vacancy in the cache."""
+    blob = zlib.compress(html.encode("utf-8")) if html else None
+    conn.execute(
+        "INSERT OR REPLACE INTO details (jobref, status, fetched_at, html, detail_text) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (jobref, status, time.time(), blob, text),
+    )
+
+
+def load_details(conn, jobrefs):
+    """Return a DataFrame of cached detail rows for the given jobrefs."""
+    jobrefs = [int(j) for j in jobrefs]
+    frames = []
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(jobrefs), 500):
+        chunk = jobrefs[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        frames.append(pd.read_sql_query(
+            f"SELECT jobref, status AS detail_status, detail_text "
+            f"FROM details WHERE jobref IN ({placeholders})",
+            conn, params=chunk,
+        ))
+    if not frames:
+        return pd.DataFrame(columns=["jobref", "detail_status", "detail_text"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# ---------------- Fetching ----------------
+def html_to_text(html):
+    """Extract readable text from a vacancy page."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return soup.get_text(" ", strip=True)
+
+
+def detail_url(jobref, url_template=DETAIL_URL, ac=DEFAULT_CODE, ec=DEFAULT_CODE):
+    """Build the vacancy page URL for a jobref and its listing's ac/ec codes."""
+    return url_template.format(jobref=jobref, jc=str(jobref).zfill(10), ac=ac, ec=ec)
+
+
+def listing_codes(df):
+    """
+    {jobref: (ac, ec)} for the rows of a listing DataFrame. Uses the ac / ec
+    columns where the extractor wrote them, otherwise the hidden span found
+    in the row's text (older CSVs keep it in a shifted column).
+    """
+    codes = {}
+    for row in df.to_dict("records"):
+        ac, ec = row.pop("ac", None), row.pop("ec", None)
+        if isinstance(ac, str) and isinstance(ec, str) and ac and ec:
+            jobref = pd.to_numeric(row.get("jobref"), errors="coerce")
+            if pd.isna(jobref):
+                continue
+            jobref = int(jobref)
+        else:
+            span = hidden_span(" ".join(str(v) for v in row.values()))
+            if span is None:
+                continue
+            jobref, ac, ec = span
+        # Keep real codes over DEFZZZ when a jobref appears more than once
+        if codes.get(jobref, (DEFAULT_CODE,))[0] == DEFAULT_CODE:
+            codes[jobref] = (ac, ec)
+    return codes
+
+
+def fetch_one(jobref, controller, url_template=DETAIL_URL, codes=(DEFAULT_CODE, DEFAULT_CODE)):
+    """
+    Fetch one vacancy page and extract its text on the worker thread.
+    Returns (jobref, status, html, text); status is None when the fetch
+    failed for good or the host's circuit breaker stayed open.
+    """
+    url = detail_url(jobref, url_template, *codes)
+    try:
+        status, html = controller.fetch(url, breaker_wait=BREAKER_WAIT)
+    except (FetchError, CircuitOpenError) as e:
+        print(f"  {jobref}: {e}")
+        return jobref, None, None, ""
+    return jobref, status, html, html_to_text(html) if html else ""
+
+
+def fetch_details(jobrefs, conn, url_template=DETAIL_URL, max_workers=MAX_WORKERS,
+                  max_per_host=MAX_PER_HOST, codes=None):
+    """
+    Fetch every jobref that is not already cached and store the results.
+    `codes` maps jobref -> (ac, ec) (see listing_codes); missing jobrefs use
+    DEFZZZ. Returns the number of pages fetched in this run.
+    """
+    codes = codes or {}
+    done = cached_jobrefs(conn)
+    todo = sorted({int(j) for j in jobrefs} - done, reverse=True)
+    print(f"{len(done)} jobrefs already cached, {len(todo)} to fetch")
+    if not todo:
+        return 0
+
+    # Worker threads are an upper bound; the controller decides how many
+    # requests are actually in flight, never more than max_per_host
+    controller = FetchController(max_limit=max_per_host)
+    fetched = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(fetch_one, j, controller, url_template,
+                               codes.get(j, (DEFAULT_CODE, DEFAULT_CODE))) for j in todo]
+        # Cache writes happen on this thread only, as results come in
+        for n, fut in enumerate(as_completed(futures), start=1):
+            jobref, status, html, text = fut.result()
+            if status is not None:
+                store_detail(conn, jobref, status, html, text)
+                fetched += 1
+            if n % 100 == 0 or n == len(todo):
+                conn.commit()
+                elapsed = time.monotonic() - started
+                limits = ", ".join(f"{h['host']} limit {h['limit']}" for h in controller.stats())
+                print(f"  {n}/{len(todo)} done ({n / elapsed:.1f} pages/s; {limits})")
+    conn.commit()
+    return fetched
+
+
+def join_details(df, conn):
+    """Left-join cached detail content onto listing rows by jobref."""
+    df = df.copy()
+    df["jobref"] = pd.to_numeric(df["jobref"], errors="coerce").astype("Int64")
+    details = load_details(conn, df["jobref"].dropna().astype(int).unique())
+    details["jobref"] = details["jobref"].astype("Int64")
+    return df.merge(details, on="jobref", how="left")
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Fetch vacancy detail pages for a listing CSV.")
+    parser.add_argument("listing_csv")
+    parser.add_argument("--out", help="output CSV (default: <listing>_details.csv)")
+    parser.add_argument("--cache", default=CACHE_DB)
+    parser.add_argument("--url-template", default=DETAIL_URL,
+                        help="vacancy URL with {jobref} or {jc} (and {ac}, {ec}) placeholders")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--max-per-host", type=int, default=MAX_PER_HOST,
+                        help="most requests in flight to one host")
+    args = parser.parse_args()
+
+    out = args.out or args.listing_csv.rsplit(".", 1)[0] + "_details.csv"
+
+    df = pd.read_csv(args.listing_csv)
+    jobrefs = pd.to_numeric(df["jobref"], errors="coerce").dropna().astype(int)
+    print(f"Read {len(df)} rows, {jobrefs.nunique()} unique jobrefs from {args.listing_csv}")
+
+    conn = open_cache(args.cache)
+    try:
+        fetched = fetch_details(jobrefs, conn, args.url_template, args.workers, args.max_per_host,
+                                listing_codes(df))
+        print(f"Fetched {fetched} new vacancy pages")
+
+        merged = join_details(df, conn)
+        merged.to_csv(out, index=False, encoding="utf-8-sig")
+        missing = merged["detail_status"].isna().sum()
+        print(f"Saved {len(merged)} rows to {out} ({missing} without detail)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# jobref_bitmap.py
+#
+# Compressed jobref sets (roaring-style) for fast cross-snapshot questions
+# such as "which vacancies are in both 2024 and 2025" or "which jobrefs in
+# this crawl were never seen before".
+#
+# A jobref is split into a high 16-bit key and a low 16-bit value. Each key
+# owns one container:
+#   - array container: sorted array("H") of low values, while it holds at
+#     most ARRAY_MAX values (2 bytes per jobref)
+#   - bitmap container: a 65536-bit Python int (8 KB), once it is denser
+# Union/intersection/difference work container by container; bitmap-bitmap
+# operations are single big-int |, &, & ~ operations.
+#
+# Named bitmaps ("snapshot/2024 May", "year/2025", "row_type/green", and
+# "seen/all" for everything recorded so far) are kept as files under
+# BITMAP_DIR. merge.py adds each merge to its year; crawl_daemon.py checks
+# every run against seen/all and records the run as a snapshot.
+#
+# Usage:
+#   python jobref_bitmap.py build                     # years, row_types and 2024/2025 snapshots
+#   python jobref_bitmap.py query "year/2024 & year/2025"
+#   python jobref_bitmap.py query "snapshot/2024 May - (year/2019 | year/2020 | year/2021 | year/2023)"
+#   python jobref_bitmap.py query '"snapshot/live_20251201-093000" - year/2024'   # quote names holding & | - ( )
+
+import argparse
+import bisect
+import os
+import re
+import struct
+import time
+from array import array
+
+from corpus import CORPUS_FILES, parse_jobref, read_rows
+
+BITMAP_DIR = "bitmaps"
+# Every jobref ever recorded; the crawler checks new rows against it
+SEEN = "seen/all"
+SNAPSHOT_DIRS = ("2024 CSVs", "2025 CSVs")
+
+ARRAY_MAX = 4096            # above this an array container is larger than a bitmap
+FULL_BITS = (1 << 65536) - 1
+
+MAGIC = b"JRBM"
+HEADER = struct.Struct("<4sI")          # magic, number of containers
+CONTAINER = struct.Struct("<HBI")       # key, kind (0 array / 1 bitmap), cardinality
+
+
+# Set bit positions of every byte value, for unpacking bitmap containers
+_BYTE_BITS = [tuple(b for b in range(8) if v >> b & 1) for v in range(256)]
+
+
+def _bits_to_array(bits):
+    """Sorted array("H") of the set bits of a bitmap container."""
+    out = array("H")
+    for i, byte in enumerate(bits.to_bytes(8192, "little")):
+        if byte:
+            base = i << 3
+            out.extend(base | b for b in _BYTE_BITS[byte])
+    return out
+
+
+def _array_to_bits(values):
+    # Set bits in a byte buffer: shifting a 65536-bit int once per value
+    # would cost a full 8 KB copy each time
+    buf = bytearray(8192)
+    for v in values:
+        buf[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _container(values=None, bits=None):
+    """The cheaper representation of a container's contents: array or bitmap."""
+    if bits is not None:
+        return _bits_to_array(bits) if bits.bit_count() <= ARRAY_MAX else bits
+    return _array_to_bits(values) if len(values) > ARRAY_MAX else values
+
+
+class JobrefBitmap:
+    """A set of non-negative 32-bit jobrefs in roaring-style containers."""
+
+    def __init__(self, jobrefs=()):
+        # key -> sorted array("H") or int bitmap
+        self.containers = {}
+        self.update(jobrefs)
+
+    # ---------------- Building ----------------
+    def update(self, jobrefs):
+        """Add many jobrefs (any order)."""
+        grouped = {}
+        for j in jobrefs:
+            grouped.setdefault(j >> 16, set()).add(j & 0xFFFF)
+        for key, lows in grouped.items():
+            current = self.containers.get(key)
+            if current is None:
+                self.containers[key] = _container(values=array("H", sorted(lows)))
+            elif isinstance(current, int):
+                self.containers[key] = current | _array_to_bits(lows)
+            else:
+                self.containers[key] = _container(values=array("H", sorted(lows.union(current))))
+
+    def add(self, jobref):
+        key, low = jobref >> 16, jobref & 0xFFFF
+        current = self.containers.get(key)
+        if current is None:
+            self.containers[key] = array("H", [low])
+        elif isinstance(current, int):
+            self.containers[key] = current | (1 << low)
+        else:
+            i = bisect.bisect_left(current, low)
+            if i == len(current) or current[i] != low:
+                current.insert(i, low)
+                if len(current) > ARRAY_MAX:
+                    self.containers[key] = _array_to_bits(current)
+
+    # ---------------- Membership ----------------
+    def __contains__(self, jobref):
+        current = self.containers.get(jobref >> 16)
+        if current is None:
+            return False
+        low = jobref & 0xFFFF
+        if isinstance(current, int):
+            return bool(current >> low & 1)
+        i = bisect.bisect_left(current, low)
+        return i < len(current) and current[i] == low
+
+    def __len__(self):
+        return sum(c.bit_count() if isinstance(c, int) else len(c) for c in self.containers.values())
+
+    def __iter__(self):
+        for key in sorted(self.containers):
+            current = self.containers[key]
+            lows = _bits_to_array(current) if isinstance(current, int) else current
+            base = key << 16
+            for low in lows:
+                yield base | low
+
+    def __eq__(self, other):
+        return isinstance(other, JobrefBitmap) and self.containers == other.containers
+
+    # ---------------- Set operations ----------------
+    def _combine(self, other, op):
+        result = JobrefBitmap()
+        if op == "or":
+            keys = self.containers.keys() | other.containers.keys()
+        elif op == "and":
+            keys = self.containers.keys() & other.containers.keys()
+        else:
+            keys = self.containers.keys()
+        for key in keys:
+            a = self.containers.get(key)
+            b = other.containers.get(key)
+            if b is None:
+                merged = (array("H", a) if not isinstance(a, int) else a) if op != "and" else None
+            elif a is None:
+                merged = array("H", b) if not isinstance(b, int) else b
+            else:
+                merged = _combine_containers(a, b, op)
+            if merged is not None and (merged if isinstance(merged, int) else len(merged)):
+                result.containers[key] = merged
+        return result
+
+    def __or__(self, other):
+        return self._combine(other, "or")
+
+    def __and__(self, other):
+        return self._combine(other, "and")
+
+    def __sub__(self, other):
+        return self._combine(other, "sub")
+
+    # ---------------- Persistence ----------------
+    def to_bytes(self):
+        parts = [HEADER.pack(MAGIC, len(self.containers))]
+        for key in sorted(self.containers):
+            current = self.containers[key]
+            if isinstance(current, int):
+                parts.append(CONTAINER.pack(key, 1, current.bit_count()))
+                parts.append(current.to_bytes(8192, "little"))
+            else:
+                parts.append(CONTAINER.pack(key, 0, len(current)))
+                parts.append(current.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a jobref bitmap file")
+        bitmap = cls()
+        offset = HEADER.size
+        for _ in range(count):
+            key, kind, cardinality = CONTAINER.unpack_from(data, offset)
+            offset += CONTAINER.size
+            if kind == 1:
+                bitmap.containers[key] = int.from_bytes(data[offset:offset + 8192], "little")
+                offset += 8192
+            else:
+                values = array("H")
+                values.frombytes(data[offset:offset + 2 * cardinality])
+                bitmap.containers[key] = values
+                offset += 2 * cardinality
+        return bitmap
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _combine_containers(a, b, op):
+    a_bits, b_bits = isinstance(a, int), isinstance(b, int)
+    if a_bits and b_bits:
+        return _container(bits=a | b if op == "or" else a & b if op == "and" else a & ~b & FULL_BITS)
+    if not a_bits and not b_bits:
+        sa, sb = set(a), set(b)
+        merged = sa | sb if op == "or" else sa & sb if op == "and" else sa - sb
+        return _container(values=array("H", sorted(merged)))
+    # Mixed: probe the array against the bitmap
+    if op == "or":
+        return (a if a_bits else b) | _array_to_bits(b if a_bits else a)
+    if op == "and":
+        bits, values = (a, b) if a_bits else (b, a)
+        data = bits.to_bytes(8192, "little")
+        return array("H", (v for v in values if data[v >> 3] >> (v & 7) & 1))
+    if a_bits:
+        return _container(bits=a & ~_array_to_bits(b) & FULL_BITS)
+    data = b.to_bytes(8192, "little")
+    return array("H", (v for v in a if not data[v >> 3] >> (v & 7) & 1))
+
+
+# ---------------- Named bitmaps on disk ----------------
+def bitmap_path(name, root=BITMAP_DIR):
+    """File for a name like "year/2024" or "snapshot/2024 May"."""
+    return os.path.join(root, *name.split("/")) + ".bm"
+
+
+def load_named(name, root=BITMAP_DIR):
+    return JobrefBitmap.load(bitmap_path(name, root))
+
+
+def save_named(name, bitmap, root=BITMAP_DIR):
+    bitmap.save(bitmap_path(name, root))
+
+
+def list_named(group, root=BITMAP_DIR):
+    """Names of the stored bitmaps in a group, e.g. ["year/2019", "year/2020", ...]."""
+    folder = os.path.join(root, group)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f"{group}/{name[:-3]}" for name in os.listdir(folder) if name.endswith(".bm"))
+
+
+def add_to_named(name, jobrefs, root=BITMAP_DIR):
+    """Merge jobrefs into a stored bitmap (created if missing). Returns the bitmap."""
+    path = bitmap_path(name, root)
+    bitmap = JobrefBitmap.load(path) if os.path.exists(path) else JobrefBitmap()
+    bitmap.update(jobrefs)
+    bitmap.save(path)
+    return bitmap
+
+
+def csv_jobrefs(path):
+    """Jobrefs of a scraper CSV grouped by row_type: {row_type: set}."""
+    by_type = {}
+    for row in read_rows(path):
+        jobref = parse_jobref(row.get("jobref"))
+        if jobref is not None:
+            by_type.setdefault(row.get("row_type") or "", set()).add(jobref)
+    return by_type
+
+
+def build(root=BITMAP_DIR):
+    """Bitmaps per year, per row_type and per snapshot CSV, plus their union."""
+    row_types = {}
+    seen = JobrefBitmap()
+    for year, path in CORPUS_FILES:
+        if not os.path.exists(path):
+            print(f"WARNING: {path} not found, skipping")
+            continue
+        by_type = csv_jobrefs(path)
+        year_bm = JobrefBitmap(set().union(*by_type.values()))
+        save_named(f"year/{year}", year_bm, root)
+        seen = seen | year_bm
+        for row_type, refs in by_type.items():
+            if row_type:
+                row_types.setdefault(row_type, set()).update(refs)
+        print(f"year/{year}: {len(year_bm)} jobrefs")
+    for row_type, refs in row_types.items():
+        save_named(f"row_type/{row_type}", JobrefBitmap(refs), root)
+        print(f"row_type/{row_type}: {len(refs)} jobrefs")
+    for folder in SNAPSHOT_DIRS:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".csv"):
+                by_type = csv_jobrefs(os.path.join(folder, name))
+                bm = JobrefBitmap(set().union(*by_type.values()))
+                save_named(f"snapshot/{name[:-4]}", bm, root)
+                seen = seen | bm
+                print(f"snapshot/{name[:-4]}: {len(bm)} jobrefs")
+    save_named(SEEN, seen, root)
+    print(f"{SEEN}: {len(seen)} jobrefs")
+
+
+# ---------------- Query expressions ----------------
+class _ExprParser:
+    """
+    name, "quoted name", ( ), & (and), | (or), - (difference); & binds
+    tighter than | and -.
+    """
+
+    TOKEN_RE = re.compile(r'\s*("[^"]*"|\(|\)|&|\||-|[^()&|\-"]+)')
+
+    def __init__(self, expr, root):
+        self.tokens = [t.strip() for t in self.TOKEN_RE.findall(expr) if t.strip()]
+        self.pos = 0
+        self.root = root
+
+    def parse(self):
+        result = self._union()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}'")
+        return result
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _union(self):
+        result = self._intersection()
+        while self._peek() in ("|", "-"):
+            op = self.tokens[self.pos]
+            self.pos += 1
+            rhs = self._intersection()
+            result = result | rhs if op == "|" else result - rhs
+        return result
+
+    def _intersection(self):
+        result = self._atom()
+        while self._peek() == "&":
+            self.pos += 1
+            result = result & self._atom()
+        return result
+
+    def _atom(self):
+        tok = self._peek()
+        if tok is None:
+            raise ValueError("Expression ends unexpectedly")
+        self.pos += 1
+        if tok == "(":
+            result = self._union()
+            if self._peek() != ")":
+                raise ValueError("Missing ')'")
+            self.pos += 1
+            return result
+        if tok.startswith('"'):
+            tok = tok[1:-1]
+        return load_named(tok, self.root)
+
+
+def evaluate(expr, root=BITMAP_DIR):
+    return _ExprParser(expr, root).parse()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jobref bitmap index.")
+    parser.add_argument("--dir", default=BITMAP_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="bitmaps for every year, row_type and snapshot")
+    q = sub.add_parser("query", help="evaluate a set expression")
+    q.add_argument("expr")
+    q.add_argument("--show", type=int, default=10, help="print this many jobrefs")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.dir)
+        return
+
+    started = time.perf_counter()
+    result = evaluate(args.expr, args.dir)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{len(result)} jobrefs ({elapsed:.2f} ms incl. loading)")
+    for i, jobref in enumerate(result):
+        if i >= args.show:
+            break
+        print(f"  {jobref}")
+
+
+if __name__ == "__main__":
+    main()
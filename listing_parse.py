@@ -0,0 +1,268 @@
+# listing_parse.py
+#
+# HTML -> rows for topjobs listing pages (the #jb-list table). This is the
+# parsing half of scrape_current_page in 2025_new.py, split out so it can run
+# on HTML that did not come from a Selenium driver (e.g. crawl_daemon.py).
+#
+# parse_validated() checks each page's rows with page_validation as they are
+# extracted and falls back to another table layout (or raises) on page 1,
+# rather than writing a whole crawl of shifted columns. Given a
+# parse_cache.ParseCache it skips the parse for tables it has seen before.
+
+import re
+
+from bs4 import BeautifulSoup
+
+from page_validation import ExtractionError, MissingTableError, validate_page
+from row_buffer import RowBuffer
+
+
+def detect_row_type(tr_element):
+    """
+    Detect if a row is green or yellow based on its styling
+    Returns: 'green' or 'yellow'
+    """
+    try:
+        # Check for background color in style attribute
+        style = tr_element.get('style', '').lower()
+        if 'background:#009966' in style or 'background: #009966' in style:
+            return 'green'
+        
+        # Check for specific class names or attributes
+        class_attr = tr_element.get('class', [])
+        if isinstance(class_attr, list):
+            class_str = ' '.join(class_attr).lower()
+        else:
+            class_str = str(class_attr).lower()
+            
+        if 'green' in class_str or '#009966' in class_str:
+            return 'green'
+        
+        # Check first td for background color
+        first_td = tr_element.find('td')
+        if first_td:
+            td_style = first_td.get('style', '').lower()
+            if 'background:#009966' in td_style or 'background: #009966' in td_style:
+                return 'green'
+                
+    except Exception as e:
+        print(f"Error detecting row type: {e}")
+    
+    # Default to yellow if no green indicators found
+    return 'yellow'
+
+
+def extract_position_and_company(pos_cell):
+    """
+    Extract position and company from position cell
+    """
+    position = ""
+    company = ""
+    
+    try:
+        # Look for h2 tag for position
+        h2_tag = pos_cell.find('h2')
+        if h2_tag:
+            # Get text from span inside h2 or directly from h2
+            span_in_h2 = h2_tag.find('span')
+            if span_in_h2:
+                position = span_in_h2.get_text(strip=True)
+            else:
+                position = h2_tag.get_text(strip=True)
+        
+        # Look for h1 tag for company
+        h1_tag = pos_cell.find('h1')
+        if h1_tag:
+            company = h1_tag.get_text(strip=True)
+        
+        # If h1 not found, try alternative extraction
+        if not company:
+            all_text = pos_cell.get_text(separator="\n", strip=True)
+            lines = [line.strip() for line in all_text.split("\n") if line.strip()]
+            if lines:
+                # Skip hidden span text (0001439616 0000000213 0000000178)
+                visible_lines = [line for line in lines if not line.isdigit() or len(line) != 10]
+                if visible_lines:
+                    # First visible line is usually position (already got from h2)
+                    if position == "" and len(visible_lines) > 0:
+                        position = visible_lines[0]
+                    # Second visible line is company
+                    if company == "" and len(visible_lines) > 1:
+                        company = visible_lines[1]
+    except Exception as e:
+        print(f"Error extracting position/company: {e}")
+    
+    return position, company
+
+
+# Hidden span of the position cell: jc (the zero-padded jobref), then the ac
+# and ec codes of the vacancy page URL, "DEFZZZ" when the ad has none:
+# "0001439616 DEFZZZ DEFZZZ" or "0001436547 0000000661 0000000492"
+HIDDEN_SPAN = re.compile(r"\b(\d{10})\s+(DEFZZZ|\d{10})\s+(DEFZZZ|\d{10})\b")
+DEFAULT_CODE = "DEFZZZ"
+
+
+def hidden_span(text):
+    """(jobref, ac, ec) from text holding a position cell's hidden span, or None."""
+    match = HIDDEN_SPAN.search(text or "")
+    if not match:
+        return None
+    jc, ac, ec = match.groups()
+    return int(jc), ac, ec
+
+
+def detail_codes(text):
+    """(ac, ec) from text holding a position cell's hidden span; DEFZZZ for both when there is none."""
+    span = hidden_span(text)
+    return span[1:] if span else (DEFAULT_CODE, DEFAULT_CODE)
+
+
+# Cell index of each field per table layout. "numbered" is the current site
+# (a # column before Job Ref No); "jobref_first" is the older layout that
+# 2026extract.py was written for.
+LAYOUTS = {
+    "numbered":     {"row_no": 0, "jobref": 1, "position": 2, "jobdesc": 3,
+                     "opening": 4, "closing": 5, "town": 6},
+    "jobref_first": {"row_no": None, "jobref": 0, "position": 1, "jobdesc": 2,
+                     "opening": 3, "closing": 4, "town": 5},
+}
+DEFAULT_LAYOUT = "numbered"
+
+
+def find_job_table(soup):
+    """
+    The job table: under #jb-list on the current site; archived pages are
+    matched by a header row with 'Job Ref No' and 'Position and Employer'
+    (as extract3.py does).
+    """
+    container = soup.select_one("#jb-list")
+    table = container.find("table") if container else None
+    if table:
+        return table
+    for table in soup.find_all("table"):
+        header = table.find("tr")
+        if not header:
+            continue
+        header_text = " ".join(cell.get_text(strip=True) for cell in header.find_all(["th", "td"]))
+        if "Job Ref No" in header_text and "Position and Employer" in header_text:
+            return table
+    return None
+
+
+def _table_rows(html, page_num):
+    """The <tr> elements of the job table, or None when the page has no table."""
+    table = find_job_table(BeautifulSoup(html, "html.parser"))
+    if not table:
+        print(f"Page {page_num}: WARNING: job table not found on this page")
+        return None
+    return table.find_all("tr")
+
+
+def _extract_rows(rows, page_num, layout=DEFAULT_LAYOUT):
+    """Extract table rows (header first) using one of LAYOUTS."""
+    cells = LAYOUTS[layout]
+    min_cells = cells["closing"] + 1
+
+    # Column-oriented rows: integer jobrefs, repeated strings stored once
+    rows_data = RowBuffer()
+
+    def cell_text(tds, field):
+        i = cells[field]
+        return tds[i].get_text(" ", strip=True) if len(tds) > i else ""
+
+    # Skip header row
+    for idx, tr in enumerate(rows[1:], start=1):
+        try:
+            tds = tr.find_all("td")
+            if len(tds) < min_cells:
+                print(f"  Row {idx}: Skipping - only {len(tds)} cells (need at least {min_cells})")
+                continue
+
+            # Detect row type
+            row_type = detect_row_type(tr)
+
+            # Row number from the # column ("1", "2", etc.); older pages have none
+            row_no = tds[cells["row_no"]].get_text(strip=True) if cells["row_no"] is not None else idx
+
+            jobref = tds[cells["jobref"]].get_text(strip=True)
+            position, company = extract_position_and_company(tds[cells["position"]])
+            ac, ec = detail_codes(tds[cells["position"]].get_text(" ", strip=True))
+
+            jobdesc = cell_text(tds, "jobdesc")
+            opening = cell_text(tds, "opening")
+            closing = cell_text(tds, "closing")
+            town = cell_text(tds, "town")
+
+            # Clean up the data
+            if position:
+                position = position.strip()
+            if company:
+                company = company.strip()
+
+            rows_data.append(page_num, row_no, jobref, position, company,
+                             jobdesc, opening, closing, town, row_type, ac, ec)
+
+        except Exception as e:
+            print(f"  Row {idx}: Error - {e}")
+            import traceback
+            traceback.print_exc()
+            continue
+
+    return rows_data
+
+
+def _print_sample(rows_data):
+    for i in range(min(3, len(rows_data))):
+        row = rows_data.row(i)
+        print(f"  Row {row['row_no']} ({row['row_type']}): Ref={row['jobref']}, "
+              f"Pos='{(row['position'] or '')[:30]}...', Co='{(row['company'] or '')[:20]}...'")
+
+
+def parse_validated(html, page_num, layout=DEFAULT_LAYOUT, cache=None):
+    """
+    Extract a page and validate the rows as they come out. If they fail with
+    `layout`, the other layouts are tried on the same parsed table.
+    Returns (rows, layout used); raises ExtractionError when no layout passes.
+    Callers pass the returned layout back in for the next page.
+
+    A later page without a job table is past the last page and comes back
+    empty; page 1 without one raises MissingTableError.
+
+    With a ParseCache, a table already parsed by this version of the code is
+    returned from the cache without parsing.
+    """
+    if cache is None:
+        return _parse_validated(html, page_num, layout)
+
+    key = cache.key(html, page_num, layout)
+    cached = cache.get(key)
+    if cached is not None:
+        print(f"Page {page_num}: {len(cached[0])} rows from parse cache ({cached[1]})")
+        return cached
+    result = _parse_validated(html, page_num, layout)
+    cache.put(key, result)
+    return result
+
+
+def _parse_validated(html, page_num, layout):
+    rows = _table_rows(html, page_num)
+    if rows is None and page_num == 1:
+        raise MissingTableError(f"Page {page_num}: no job table on the page")
+    if not rows:
+        return RowBuffer(), layout
+
+    print(f"Page {page_num}: Found {len(rows)} total rows (including header)")
+    failures = {}
+    for name in [layout] + [other for other in LAYOUTS if other != layout]:
+        rows_data = _extract_rows(rows, page_num, name)
+        problems = validate_page(rows_data)
+        if not problems:
+            if name != layout:
+                print(f"Page {page_num}: switched extraction layout {layout} -> {name}")
+            _print_sample(rows_data)
+            print(f"Page {page_num}: Successfully extracted {len(rows_data)} rows ({name})")
+            return rows_data, name
+        failures[name] = problems
+
+    detail = "; ".join(f"{name}: {', '.join(problems)}" for name, problems in failures.items())
+    raise ExtractionError(f"Page {page_num}: rows failed validation with every layout ({detail})")
@@ -0,0 +1,30 @@
+# listing_urls.py
+#
+# Where the topjobs.lk listing pages live, for the crawlers that fetch them
+# directly (crawl_daemon.py, work_queue.py) rather than through a browser.
+#
+# The live crawl reads the same all-vacancies listing (FA=AV) as 2025_new.py.
+# Wayback only has captures of the URL that was archived, the open-vacancies
+# search extract3.py/extract4.py read, so backfills have to request that one.
+#
+# Usage:
+#   LIVE_URL.format(page=3)
+#   WAYBACK_URL.format(timestamp="20230326214532", page=3)
+#   wayback_time("20230326214532")      # "2023-03-26T21:45:32"
+
+from datetime import datetime
+
+LISTING_PATH = "topjobs.lk/applicant/vacancybyfunctionalarea.jsp?FA=AV&pageNo={page}"
+ARCHIVED_LISTING_PATH = ("topjobs.lk/applicant/vacancybyfunctionalarea.jsp?FA=&jst=OPEN&sQut=&txtKeyWord="
+                         "&chkGovt=&chkParttime=&chkWalkin=&chkNGO=&pageNo={page}")
+LIVE_URL = "https://www." + LISTING_PATH
+# "id_" asks Wayback for the archived HTML without its toolbar
+WAYBACK_URL = "https://web.archive.org/web/{timestamp}id_/https://" + ARCHIVED_LISTING_PATH
+
+
+def wayback_time(timestamp):
+    """ISO time of a full Wayback timestamp ("20250313165948"); None when it is partial."""
+    try:
+        return datetime.strptime(timestamp, "%Y%m%d%H%M%S").isoformat()
+    except ValueError:
+        return None
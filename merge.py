@@ -2,8 +2,15 @@ import pandas as pd
 import glob
 import os
 
+import aggregates
+import search_index
+import warehouse
+from jobref_bitmap import SEEN, JobrefBitmap, add_to_named, list_named, load_named
+
 # Define the folder containing your CSV files
 csv_folder = "2025 CSVs"
+# Year the merged jobrefs are filed under in the bitmap index
+merge_year = 2025
 
 # Check if folder exists
 if not os.path.exists(csv_folder):
@@ -117,6 +124,39 @@ os.chdir(original_dir)
 output_filename = "2025_merged.csv"
 merged_df.to_csv(output_filename, index=False, encoding="utf-8-sig")
 
+# Update the dashboard count tables with rows not counted before
+agg_conn = aggregates.open_db()
+new_rows = aggregates.ingest_rows(agg_conn, merged_df.to_dict("records"))
+agg_conn.close()
+print(f"Aggregates: counted {new_rows} new rows")
+
+# Upsert the merged rows into the listing warehouse; only changed jobrefs cost anything
+wh_conn = warehouse.open_db()
+merged_records = merged_df.to_dict("records")
+# The snapshots were scraped no earlier than their newest opening date; "now"
+# would let an old merge overwrite listings scraped since
+new_listings, updated_listings = warehouse.upsert_rows(wh_conn, merged_records, source=output_filename,
+                                                       seen=warehouse.rows_seen(merged_records))
+wh_conn.close()
+print(f"Warehouse: {new_listings} new, {updated_listings} updated listings")
+
+# Make this year's new rows searchable
+indexed = search_index.add_to_index(merged_records, merge_year)
+print(f"Search index: added {indexed} new rows")
+
+# Add this year's jobrefs to the bitmap index and check them against earlier years
+merged_refs = pd.to_numeric(merged_df["jobref"], errors="coerce").dropna().astype(int).tolist()
+earlier = JobrefBitmap()
+for name in list_named("year"):
+    if name != f"year/{merge_year}":
+        earlier = earlier | load_named(name)
+seen_before = sum(jobref in earlier for jobref in merged_refs)
+year_bitmap = add_to_named(f"year/{merge_year}", merged_refs)
+# seen/all is what crawl_daemon.py checks each run against
+add_to_named(SEEN, merged_refs)
+print(f"Bitmap index: year/{merge_year} now holds {len(year_bitmap)} jobrefs "
+      f"({seen_before} of this merge already appear in earlier years)")
+
 print("\n" + "="*50)
 print("DUPLICATE REMOVAL SUMMARY")
 print("="*50)
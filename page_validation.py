@@ -0,0 +1,148 @@
+# page_validation.py
+#
+# Sanity checks on one page of extracted rows, run as soon as the page is
+# parsed. A layout mismatch (see topjobs_titles_all_pages.csv: jobref holding
+# row numbers, company empty, "0001436596 DEFZZZ DEFZZZ ..." in the snippet)
+# then shows up on page 1 instead of after the whole crawl.
+#
+# Checks work a column at a time on a RowBuffer: the jobref column is a flat
+# int array, and text columns are dictionary-encoded, so each distinct date or
+# snippet is tested once and the result counted over its codes.
+#
+#   jobref range       real refs are 5-7 digit numbers, not row numbers
+#   jobref order       listings are newest first, so refs mostly descend
+#   date parseability  non-empty dates must parse as "Mon Dec 01 2025"
+#   column shift       hidden-span junk in the snippet, company never filled
+#
+# Usage:
+#   problems = validate_page(rows)      # [] when the page looks right
+#   python page_validation.py topjobs_titles_all_pages.csv 2025_merged.csv
+
+import argparse
+import csv
+import operator
+import re
+from itertools import groupby
+
+from corpus import parse_date
+from row_buffer import COLUMNS, RowBuffer
+
+JOBREF_MIN = 10_000
+JOBREF_MAX = 10_000_000
+
+MAX_BAD_FRACTION = 0.2      # tolerated share of rows failing a check
+MIN_DESCENDING = 0.7        # share of consecutive jobrefs that must descend (featured rows break order)
+MIN_ROWS_FOR_ORDER = 5
+
+# Hidden spans of the position cell: "0001436596 DEFZZZ DEFZZZ ..."
+HIDDEN_SPAN = re.compile(r"^\d{10}\b|\bDEFZZZ\b")
+
+DATE_COLUMNS = ("opening_date", "closing_date")
+
+
+class ExtractionError(Exception):
+    """Extracted rows failed validation with every available layout."""
+
+
+class MissingTableError(ExtractionError):
+    """Page 1 has no job table: an error or placeholder page, not an empty listing."""
+
+
+def _fraction(count, total):
+    return count / total if total else 0.0
+
+
+def _bad_codes(column, is_bad):
+    """Number of rows of a dictionary-encoded column whose value is_bad; each distinct value is tested once."""
+    flags = [is_bad(value) for value in column.categories]
+    if not any(flags):
+        return 0
+    counts = [0] * len(flags)
+    for code in column.codes:
+        counts[code] += 1
+    return sum(n for n, bad in zip(counts, flags) if bad)
+
+
+def _bad_date(value):
+    value = (value or "").strip()
+    return bool(value) and parse_date(value) is None
+
+
+def validate_page(rows):
+    """
+    Check one page of rows. Returns a list of problem descriptions, empty
+    when the page looks like a correctly parsed listing.
+    """
+    n = len(rows)
+    if not n:
+        return []
+    problems = []
+    names = rows.names
+
+    if "jobref" in names:
+        refs = rows.columns[names.index("jobref")].values
+        out_of_range = sum(1 for v in refs if not JOBREF_MIN <= v <= JOBREF_MAX)
+        if _fraction(out_of_range, n) > MAX_BAD_FRACTION:
+            problems.append(f"jobref: {out_of_range}/{n} values outside {JOBREF_MIN}..{JOBREF_MAX} "
+                            f"(first: {list(refs[:3])})")
+        if n >= MIN_ROWS_FOR_ORDER:
+            descending = sum(map(operator.gt, refs, refs[1:]))
+            if _fraction(descending, n - 1) < MIN_DESCENDING:
+                problems.append(f"jobref: only {descending}/{n - 1} consecutive values descend")
+            if list(refs) == list(range(refs[0], refs[0] + n)):
+                problems.append("jobref: values are consecutive row numbers")
+
+    for name in DATE_COLUMNS:
+        if name in names:
+            bad = _bad_codes(rows.columns[names.index(name)], _bad_date)
+            if _fraction(bad, n) > MAX_BAD_FRACTION:
+                problems.append(f"{name}: {bad}/{n} values are not dates")
+
+    if "jobdesc_snippet" in names:
+        junk = _bad_codes(rows.columns[names.index("jobdesc_snippet")],
+                          lambda value: bool(HIDDEN_SPAN.search(value or "")))
+        if _fraction(junk, n) > MAX_BAD_FRACTION:
+            problems.append(f"jobdesc_snippet: {junk}/{n} values hold hidden-span text (column shift)")
+
+    if "company" in names:
+        company = rows.columns[names.index("company")]
+        if _bad_codes(company, lambda value: not (value or "").strip()) == n:
+            problems.append("company: empty on every row")
+
+    return problems
+
+
+# ---------------- CLI ----------------
+def check_csv(path):
+    """Validate an extracted CSV page by page (whole file when it has no page column)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = [c for c in reader.fieldnames if c in COLUMNS]
+        bad_pages = 0
+        pages = 0
+        for page, page_rows in groupby(reader, key=lambda row: row.get("page")):
+            rows = RowBuffer(columns)
+            for row in page_rows:
+                rows.append(*(row[c] for c in columns))
+            pages += 1
+            problems = validate_page(rows)
+            if problems:
+                bad_pages += 1
+                if bad_pages <= 5:
+                    print(f"{path} page {page or '-'}:")
+                    for problem in problems:
+                        print(f"  {problem}")
+    print(f"{path}: {bad_pages}/{pages} pages failed validation")
+    return bad_pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate extracted listing CSVs.")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    for path in args.paths:
+        check_csv(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# parse_cache.py
+#
+# Cache of parsed listing pages. Repeated Wayback snapshots of the same
+# content and repeated polls of an unchanged live page hash to the same key,
+# so they cost one hash instead of a BeautifulSoup parse.
+#
+# key     = hash(extractor, extractor version, page number, layout,
+#                normalized #jb-list table HTML)
+# version = hash of the extractor's source files, so editing the extraction
+#           code invalidates its entries without anyone bumping a number
+#
+# Normalizing keeps only the job table (the rest of the page carries session
+# ids, ads and the Wayback toolbar), drops Wayback URL rewriting and the
+# ;jsessionid=... the site writes into links for cookieless clients such as
+# http.client (a new one on every poll), and collapses whitespace. Entries live in SQLite so they survive between runs and are
+# shared by crawl_daemon threads and work_queue processes; the cache holds at
+# most max_entries pages and evicts the least recently used.
+#
+# Usage:
+#   cache = ParseCache()
+#   rows, layout = parse_validated(html, page_num, layout, cache=cache)
+#
+#   python parse_cache.py stats
+#   python parse_cache.py clear
+
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+CACHE_DB = "parse_cache.sqlite"
+MAX_ENTRIES = 10_000
+TRIM_EVERY = 100            # puts between checks of the entry count
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# Everything parse_validated's output depends on
+LISTING_SOURCES = ("listing_parse.py", "page_validation.py", "row_buffer.py", "corpus.py")
+
+_JB_LIST = re.compile(r"""\bid\s*=\s*["']?jb-list\b""", re.I)
+_TABLE_TAG = re.compile(r"<(/?)table\b", re.I)
+_WAYBACK_PREFIX = re.compile(r"(?:https?:)?(?://web\.archive\.org)?/web/\d{1,14}(?:[a-z]{2}_)?/", re.I)
+_SESSION_ID = re.compile(r";jsessionid=[^?\"'#\s>]*", re.I)
+_SPACE = re.compile(r"\s+")
+
+
+def source_version(paths):
+    """Hash of the given source files (relative paths are next to this file)."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(os.path.join(_HERE, path), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def listing_table(html):
+    """The first <table>...</table> inside #jb-list, or the whole page when there is none."""
+    anchor = _JB_LIST.search(html)
+    if not anchor:
+        return html
+    depth = 0
+    start = None
+    for tag in _TABLE_TAG.finditer(html, anchor.end()):
+        if not tag.group(1):
+            if start is None:
+                start = tag.start()
+            depth += 1
+        elif start is not None:
+            depth -= 1
+            if depth == 0:
+                return html[start:html.index(">", tag.end()) + 1]
+    return html[start:] if start is not None else html
+
+
+def normalize(html):
+    table = _SESSION_ID.sub("", _WAYBACK_PREFIX.sub("", listing_table(html)))
+    return _SPACE.sub(" ", table).strip()
+
+
+class ParseCache:
+    """
+    LRU cache of one extractor's parse results. `sources` are the files whose
+    contents define the extractor's version; a script with its own
+    extraction code passes its own file.
+    """
+
+    def __init__(self, path=CACHE_DB, extractor="listing_parse", sources=LISTING_SOURCES,
+                 max_entries=MAX_ENTRIES):
+        self.path = path
+        self.extractor = extractor
+        self.version = source_version(sources)
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.puts = 0
+
+        conn = self._conn()
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS parse_cache (
+                    key       TEXT PRIMARY KEY,
+                    extractor TEXT NOT NULL,
+                    version   TEXT NOT NULL,
+                    value     BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS parse_cache_lru ON parse_cache (last_used);
+                """
+            )
+            # Results of an older version of this extractor can never be hit again
+            conn.execute("DELETE FROM parse_cache WHERE extractor = ? AND version != ?",
+                         (extractor, self.version))
+
+    def _conn(self):
+        """This thread's connection, opened once and kept."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def key(self, html, *parts):
+        """Cache key of a page; parts are whatever else the result depends on (page number, layout)."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{self.extractor}\0{self.version}\0{parts!r}\0".encode())
+        digest.update(normalize(html).encode("utf-8", errors="surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """The cached value, or None. A hit marks the entry as recently used."""
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM parse_cache WHERE key = ?", (key,)).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        with conn:
+            conn.execute("UPDATE parse_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (key, extractor, version, value, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, self.extractor, self.version,
+                 pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time()),
+            )
+        with self.lock:
+            self.puts += 1
+            trim = self.puts % TRIM_EVERY == 1
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """Evict least recently used entries beyond max_entries. Returns how many were removed."""
+        conn = self._conn()
+        with conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM parse_cache").fetchone()
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            conn.execute(
+                "DELETE FROM parse_cache WHERE key IN "
+                "(SELECT key FROM parse_cache ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+        return excess
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "puts": self.puts}
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Parsed-page cache.")
+    parser.add_argument("--db", default=CACHE_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="entries and size per extractor version")
+    sub.add_parser("clear", help="remove every entry")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS parse_cache (key TEXT PRIMARY KEY, extractor TEXT, "
+                     "version TEXT, value BLOB, last_used REAL)")
+        if args.command == "stats":
+            print(f"listing_parse version now: {source_version(LISTING_SOURCES)}")
+            for extractor, version, n, size in conn.execute(
+                    "SELECT extractor, version, COUNT(*), SUM(LENGTH(value)) FROM parse_cache "
+                    "GROUP BY extractor, version ORDER BY extractor"):
+                print(f"  {extractor:<16} {version}  {n:>6} pages  {size / 1e6:.1f} MB")
+        else:
+            with conn:
+                conn.execute("DELETE FROM parse_cache")
+            print("Cache cleared")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# row_buffer.py
+#
+# Column-oriented row storage for the extractors. Instead of a fresh dict of
+# strings per table row, rows are appended into typed columns:
+#
+#   page, row_no, jobref   -> array("q") of ints (MISSING when not a number)
+#   every text column      -> array("i") of codes + one copy of each distinct
+#                             string ("Please refer the vacancy", "yellow",
+#                             dates, towns, ... are stored once)
+#
+# to_pandas() turns each column into int64 / Int64 or a pandas Categorical with
+# a single memcpy of its array, with no per-row work; to_arrow() does the same
+# for pyarrow. (Copying once keeps the arrays free to grow afterwards: an
+# array.array cannot be resized while numpy is viewing its buffer.)
+#
+# Usage:
+#   rows = RowBuffer()
+#   rows.append(page, row_no, jobref, position, company, jobdesc, opening, closing, town, row_type, ac, ec)
+#   df = rows.to_pandas()
+#
+#   python row_buffer.py bench      # memory/conversion numbers on the merged corpus
+
+import argparse
+import time
+import tracemalloc
+from array import array
+
+# Columns written by scrape_current_page, in output order. ac / ec are the
+# advertiser codes from the position cell's hidden span, needed for the
+# vacancy detail URL (fetch_details.py).
+COLUMNS = ("page", "row_no", "jobref", "position", "company", "jobdesc_snippet",
+           "opening_date", "closing_date", "town", "row_type", "ac", "ec")
+INT_COLUMNS = ("page", "row_no", "jobref")
+
+MISSING = -1
+REPORT_BAD = 5              # non-integer values printed per column; the rest are only counted
+
+
+class IntColumn:
+    """
+    Integer column. "123" and "123.0" are stored as 123; blanks as MISSING.
+    Anything else is stored as MISSING too, but counted in `bad` and the
+    first few printed, since it usually means the wrong cell was read.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.values = array("q")
+        self.bad = 0
+
+    def append(self, value):
+        if not isinstance(value, int):
+            text = "" if value is None else str(value).strip()
+            try:
+                value = int(text)
+            except ValueError:
+                value = self._not_int(text)
+        self.values.append(value)
+
+    def _not_int(self, text):
+        try:
+            number = float(text)
+        except ValueError:
+            number = None
+        if number is not None and number.is_integer():
+            return int(number)
+        if text and text.lower() != "nan":
+            self.bad += 1
+            if self.bad <= REPORT_BAD:
+                print(f"  {self.name or 'int column'}: {text[:40]!r} is not an integer, stored as missing")
+        return MISSING
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        return None if value == MISSING else value
+
+    def extend(self, other):
+        self.values.extend(other.values)
+        self.bad += other.bad
+
+    def to_pandas(self):
+        import numpy as np
+        import pandas as pd
+
+        values = np.frombuffer(self.values, dtype=np.int64).copy()
+        missing = values == MISSING
+        if missing.any():
+            return pd.arrays.IntegerArray(values, missing)
+        return values
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        values = np.frombuffer(self.values, dtype=np.int64).copy()
+        return pa.array(values, mask=values == MISSING)
+
+
+class DictColumn:
+    """Dictionary-encoded text column: int32 codes into a list of distinct strings."""
+
+    def __init__(self):
+        self.codes = array("i")
+        self.categories = []
+        self.lookup = {}
+
+    def append(self, value):
+        self.codes.append(self._code(value))
+
+    def __getitem__(self, i):
+        return self.categories[self.codes[i]]
+
+    def extend(self, other):
+        remap = array("i", (self._code(value) for value in other.categories))
+        self.codes.extend(remap[code] for code in other.codes)
+
+    def _code(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def to_pandas(self):
+        import numpy as np
+        import pandas as pd
+
+        codes = np.frombuffer(self.codes, dtype=np.int32).copy()
+        return pd.Categorical.from_codes(codes, categories=pd.Index(self.categories, dtype=object))
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        codes = pa.array(np.frombuffer(self.codes, dtype=np.int32).copy())
+        return pa.DictionaryArray.from_arrays(codes, pa.array(self.categories, type=pa.string()))
+
+
+class RowBuffer:
+    """
+    Rows of one or more listing pages, stored by column. `columns` picks the
+    subset (and order) of COLUMNS an extractor produces.
+    """
+
+    def __init__(self, columns=COLUMNS):
+        self.names = tuple(columns)
+        self.columns = [IntColumn(name) if name in INT_COLUMNS else DictColumn() for name in self.names]
+
+    def __len__(self):
+        return len(self.columns[0].values if self.names[0] in INT_COLUMNS else self.columns[0].codes)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, *values):
+        """Add one row; values are given in the buffer's column order."""
+        if len(values) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values ({self.names}), got {len(values)}")
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def extend(self, other):
+        """Append every row of another buffer with the same columns."""
+        if other.names != self.names:
+            raise ValueError(f"Column mismatch: {other.names} vs {self.names}")
+        for column, other_column in zip(self.columns, other.columns):
+            column.extend(other_column)
+
+    def row(self, i):
+        """Row i as a dict, like the extractors used to build."""
+        return {name: column[i] for name, column in zip(self.names, self.columns)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, name):
+        """Plain Python list of one column's values."""
+        col = self.columns[self.names.index(name)]
+        return [col[i] for i in range(len(self))]
+
+    def to_pandas(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: column.to_pandas()
+                             for name, column in zip(self.names, self.columns)}, copy=False)
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        return pa.table([column.to_arrow() for column in self.columns], names=list(self.names))
+
+
+# ---------------- Benchmark ----------------
+def bench():
+    """
+    Compare list-of-dicts rows with RowBuffer on the merged corpus:
+    peak memory while extracting, and DataFrame conversion time.
+    """
+    from corpus import CORPUS_FILES, read_rows
+
+    source = []
+    for _, path in CORPUS_FILES:
+        for row in read_rows(path):
+            source.append(tuple(str(row.get(c) or "").encode() for c in COLUMNS))
+    print(f"{len(source)} rows")
+
+    # Each measured loop decodes fresh strings per row, as BeautifulSoup's
+    # get_text() hands them to the extractor
+    tracemalloc.start()
+    dict_rows = []
+    for raw in source:
+        dict_rows.append(dict(zip(COLUMNS, (v.decode() for v in raw))))
+    _, dict_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    buffer = RowBuffer()
+    for raw in source:
+        buffer.append(*(v.decode() for v in raw))
+    _, buffer_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Peak memory, list of dicts: {dict_peak / 1e6:.1f} MB")
+    print(f"Peak memory, RowBuffer:     {buffer_peak / 1e6:.1f} MB")
+
+    try:
+        import pandas as pd
+    except ImportError:
+        print("pandas not installed, skipping conversion timing")
+        return
+    started = time.perf_counter()
+    pd.DataFrame(dict_rows)
+    print(f"pd.DataFrame(list of dicts): {(time.perf_counter() - started) * 1000:.1f} ms")
+    started = time.perf_counter()
+    buffer.to_pandas()
+    print(f"RowBuffer.to_pandas():       {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Column-oriented row buffer.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("bench", help="compare with list-of-dicts rows on the merged corpus")
+    parser.parse_args()
+    bench()
+
+
+if __name__ == "__main__":
+    main()
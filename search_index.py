@@ -0,0 +1,425 @@
+# search_index.py
+#
+# In-memory inverted index over position, company and town for the merged
+# corpus. Posting lists are sorted arrays of document ids; the index is saved
+# to disk and new scraper rows can be added without a rebuild.
+#
+# Query syntax (terms are ANDed by default):
+#   data engineer                 both words, any field
+#   position:engineer company:bank*   field-qualified, "*" for prefix
+#   engineer OR developer         either
+#   -intern / NOT intern          exclude
+#   (data OR software) engineer   grouping
+#
+# Usage:
+#   python search_index.py build
+#   python search_index.py add "2025 CSVs/2025.csv" --year 2025
+#
+# 2025_new.py, merge.py and crawl_daemon.py add their rows through
+# add_to_index() after each crawl, so the saved index stays current.
+#   python search_index.py query "position:data position:engineer company:bank*" --since 2020
+
+import argparse
+import bisect
+import operator
+import os
+import pickle
+import re
+import time
+from array import array
+from itertools import chain, compress
+
+from corpus import CORPUS_FILES, parse_jobref, read_rows
+
+INDEX_FILE = "search_index.pkl"
+FIELDS = ("position", "company", "town")
+ROW_TYPES = ("", "yellow", "green")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens of a field value."""
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class SearchIndex:
+    """
+    Inverted index with one posting dict per field. Document ids are assigned
+    in insertion order, so appending a new id keeps every posting list sorted.
+    """
+
+    def __init__(self):
+        self.postings = {field: {} for field in FIELDS}
+        # Per-document columns, indexed by doc id
+        self.jobrefs = array("I")
+        self.years = array("H")
+        self.row_types = array("B")
+        self.stored = {field: [] for field in FIELDS}
+        self.doc_by_jobref = {}
+        # Filters: crawl year -> [start, end) doc id runs (ids are assigned in
+        # insertion order, so a year is a handful of runs), row_type code -> doc ids
+        self.year_runs = {}
+        self.type_docs = {}
+        self._vocab = {}
+        self._term_docs = {}
+
+    def __len__(self):
+        return len(self.jobrefs)
+
+    # ---------------- Building ----------------
+    def add_row(self, row, year):
+        """Index one scraper row. Returns False if its jobref is already indexed."""
+        jobref = parse_jobref(row.get("jobref"))
+        if jobref is None or jobref in self.doc_by_jobref:
+            return False
+
+        doc = len(self.jobrefs)
+        self.doc_by_jobref[jobref] = doc
+        self.jobrefs.append(jobref)
+        self.years.append(year)
+        row_type = row.get("row_type") or ""
+        type_code = ROW_TYPES.index(row_type) if row_type in ROW_TYPES else 0
+        self.row_types.append(type_code)
+        runs = self.year_runs.setdefault(year, [])
+        if runs and runs[-1][1] == doc:
+            runs[-1][1] = doc + 1
+        else:
+            runs.append([doc, doc + 1])
+        self.type_docs.setdefault(type_code, array("I")).append(doc)
+        self._term_docs.clear()
+
+        for field in FIELDS:
+            value = row.get(field)
+            # pandas hands missing values over as NaN
+            if not isinstance(value, str):
+                value = ""
+            self.stored[field].append(value)
+            field_postings = self.postings[field]
+            for token in set(tokenize(value)):
+                plist = field_postings.get(token)
+                if plist is None:
+                    field_postings[token] = plist = array("I")
+                    self._vocab.pop(field, None)
+                plist.append(doc)
+        return True
+
+    def add_rows(self, rows, year):
+        """Index every new row (dicts, a RowBuffer or df.to_dict("records")). Returns the number added."""
+        return sum(self.add_row(row, year) for row in rows)
+
+    def add_csv(self, path, year):
+        """Index every new row of a CSV. Returns the number of rows added."""
+        return self.add_rows(read_rows(path), year)
+
+    # ---------------- Persistence ----------------
+    def save(self, path=INDEX_FILE):
+        state = {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        index = cls()
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index.__dict__.update(state)
+        return index
+
+    # ---------------- Lookups ----------------
+    def _sorted_vocab(self, field):
+        vocab = self._vocab.get(field)
+        if vocab is None:
+            vocab = self._vocab[field] = sorted(self.postings[field])
+        return vocab
+
+    def term_docs(self, token, fields=FIELDS, prefix=False):
+        """
+        Sorted doc ids containing a token (or any token with that prefix).
+        Merged lists are cached until the next add.
+        """
+        key = (token, fields, prefix)
+        docs = self._term_docs.get(key)
+        if docs is not None:
+            return docs
+        plists = []
+        for field in fields:
+            field_postings = self.postings[field]
+            if not prefix:
+                plist = field_postings.get(token)
+                if plist is not None:
+                    plists.append(plist)
+                continue
+            vocab = self._sorted_vocab(field)
+            i = bisect.bisect_left(vocab, token)
+            while i < len(vocab) and vocab[i].startswith(token):
+                plists.append(field_postings[vocab[i]])
+                i += 1
+        docs = self._term_docs[key] = _union(plists)
+        return docs
+
+    def match(self, query, years=None, since=None, until=None, row_type=None):
+        """
+        Evaluate a query and return the matching doc ids, most recently
+        indexed first. years/since/until filter on crawl year, row_type on
+        "green"/"yellow".
+        """
+        docs = _QueryParser(self, query).parse()
+
+        if years is not None or since is not None or until is not None:
+            runs = sorted(run for y, year_runs in self.year_runs.items()
+                          if (years is None or y in years)
+                          and (since is None or y >= since)
+                          and (until is None or y <= until)
+                          for run in year_runs)
+            docs = _in_runs(docs, runs)
+        if row_type:
+            code = ROW_TYPES.index(row_type)
+            docs = _intersect(docs, self.type_docs.get(code, array("I")))
+
+        return docs[::-1]
+
+    def search(self, query, limit=None, **filters):
+        """Like match(), but returns up to `limit` rows as dicts."""
+        hits = self.match(query, **filters)
+        if limit is not None:
+            hits = hits[:limit]
+        return [self.document(doc) for doc in hits]
+
+    def document(self, doc):
+        row = {"jobref": self.jobrefs[doc], "year": self.years[doc],
+               "row_type": ROW_TYPES[self.row_types[doc]]}
+        for field in FIELDS:
+            row[field] = self.stored[field][doc]
+        return row
+
+
+# ---------------- Posting-list operations ----------------
+# Every result is a sorted array("I") of doc ids, and posting lists are
+# returned as is, so nothing here modifies its inputs. Lists of similar size
+# are merged with sorted() (which merges the already-sorted runs in C) and
+# filtered with compress/map; a list much shorter than the other is walked
+# with bisect instead.
+GALLOP_RATIO = 32
+
+
+def _merged(lists):
+    return sorted(chain.from_iterable(lists)) if len(lists) > 2 else sorted(lists[0] + lists[1])
+
+
+def _union(plists):
+    plists = [plist for plist in plists if plist]
+    if not plists:
+        return array("I")
+    if len(plists) == 1:
+        return plists[0]
+    merged = _merged(plists)
+    # Keep each value unless it equals the one before it
+    return array("I", chain(merged[:1], compress(merged[1:], map(operator.ne, merged[1:], merged))))
+
+
+def _intersect(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return a
+    if len(a) * GALLOP_RATIO < len(b):
+        result = array("I")
+        lo, end = 0, len(b)
+        for doc in a:
+            lo = bisect.bisect_left(b, doc, lo)
+            if lo == end:
+                break
+            if b[lo] == doc:
+                result.append(doc)
+        return result
+    # Neither list repeats a value, so a value in both appears twice in a row
+    merged = _merged([a, b])
+    return array("I", compress(merged, map(operator.eq, merged, merged[1:])))
+
+
+def _in_runs(docs, runs):
+    """Doc ids inside any of the sorted, disjoint [start, end) runs: one slice per run."""
+    result = array("I")
+    lo = 0
+    for start, end in runs:
+        lo = bisect.bisect_left(docs, start, lo)
+        hi = bisect.bisect_left(docs, end, lo)
+        result.extend(docs[lo:hi])
+        lo = hi
+    return result
+
+
+def _difference(a, b):
+    """Doc ids of a that are not in b."""
+    common = _intersect(a, b)
+    if not common:
+        return a
+    # Values of a that are also in common appear twice in a row; keep the rest
+    merged = _merged([a, common])
+    differs_before = chain((True,), map(operator.ne, merged[1:], merged))
+    differs_after = chain(map(operator.ne, merged, merged[1:]), (True,))
+    return array("I", compress(merged, map(operator.and_, differs_before, differs_after)))
+
+
+class _QueryParser:
+    """Recursive-descent parser for the query syntax; evaluates to sorted doc ids."""
+
+    TOKEN_RE = re.compile(r"\(|\)|-|[^\s()]+")
+
+    def __init__(self, index, query):
+        self.index = index
+        self.tokens = self.TOKEN_RE.findall(query)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        tok = self._peek()
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        if not self.tokens:
+            return array("I")
+        result = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"Unexpected '{self._peek()}' in query")
+        return result
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == "OR":
+            self._next()
+            result = _union([result, self._and()])
+        return result
+
+    def _and(self):
+        include, exclude = [], []
+        while self._peek() not in (None, ")", "OR"):
+            negate = False
+            if self._peek() in ("-", "NOT"):
+                self._next()
+                negate = True
+            docs = self._atom()
+            (exclude if negate else include).append(docs)
+        if not include:
+            if exclude:
+                raise ValueError("A query needs at least one positive term")
+            raise ValueError("Empty query group")
+        # Intersect smallest first
+        include.sort(key=len)
+        result = include[0]
+        for docs in include[1:]:
+            result = _intersect(result, docs)
+            if not result:
+                break
+        for docs in exclude:
+            result = _difference(result, docs)
+        return result
+
+    def _atom(self):
+        tok = self._next()
+        if tok is None:
+            raise ValueError("Query ends unexpectedly")
+        if tok == "(":
+            result = self._or()
+            if self._next() != ")":
+                raise ValueError("Missing ')' in query")
+            return result
+
+        fields = FIELDS
+        if ":" in tok:
+            field, tok = tok.split(":", 1)
+            if field not in FIELDS:
+                raise ValueError(f"Unknown field '{field}' (expected one of {FIELDS})")
+            fields = (field,)
+        prefix = tok.endswith("*")
+        words = tokenize(tok)
+        if not words:
+            return array("I")
+        # "c++" or "front-end" split into several words: require all of them
+        result = None
+        for i, word in enumerate(words):
+            docs = self.index.term_docs(word, fields, prefix and i == len(words) - 1)
+            result = docs if result is None else _intersect(result, docs)
+        return result
+
+
+def build(path=INDEX_FILE):
+    """Build the index from every file in CORPUS_FILES and save it."""
+    index = SearchIndex()
+    for year, csv_path in CORPUS_FILES:
+        if not os.path.exists(csv_path):
+            print(f"WARNING: {csv_path} not found, skipping")
+            continue
+        added = index.add_csv(csv_path, year)
+        print(f"Indexed {csv_path}: {added} rows")
+    index.save(path)
+    print(f"Saved index with {len(index)} documents to {path}")
+    return index
+
+
+def add_to_index(rows, year, path=INDEX_FILE):
+    """
+    Add new rows to the saved index (creating it when missing) and save it.
+    Scrapers call this after each crawl. Returns the number of rows added.
+    """
+    index = SearchIndex.load(path) if os.path.exists(path) else SearchIndex()
+    added = index.add_rows(rows, year)
+    if added:
+        index.save(path)
+    return added
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Search positions, companies and towns.")
+    parser.add_argument("--index", default=INDEX_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("build", help="index every merged CSV")
+
+    add = sub.add_parser("add", help="add new rows from a scraper CSV")
+    add.add_argument("csv")
+    add.add_argument("--year", type=int, required=True)
+
+    query = sub.add_parser("query", help="run a query")
+    query.add_argument("query")
+    query.add_argument("--year", type=int, action="append", dest="years")
+    query.add_argument("--since", type=int)
+    query.add_argument("--until", type=int)
+    query.add_argument("--row-type", choices=["green", "yellow"])
+    query.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.index)
+        return
+
+    index = SearchIndex.load(args.index)
+    if args.command == "add":
+        added = index.add_csv(args.csv, args.year)
+        index.save(args.index)
+        print(f"Added {added} new rows from {args.csv} ({len(index)} documents total)")
+        return
+
+    started = time.perf_counter()
+    try:
+        hits = index.match(args.query, years=args.years, since=args.since,
+                           until=args.until, row_type=args.row_type)
+    except ValueError as e:
+        parser.error(f"bad query: {e}")
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{len(hits)} matches in {elapsed:.3f} ms")
+    for row in map(index.document, hits[:args.limit]):
+        print(f"  {row['year']}  {row['jobref']:>8}  {row['position'][:45]:45}  "
+              f"{row['company'][:35]:35}  {row['town']}")
+
+
+if __name__ == "__main__":
+    main()
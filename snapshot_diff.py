@@ -0,0 +1,248 @@
+# snapshot_diff.py
+#
+# Listing lifecycle tracking. Every crawl CSV is a full snapshot of the open
+# vacancies; recording snapshots in crawl order diffs each one against the
+# previous (sort-merge over integer jobrefs) and appends the changes to a
+# compact binary event log:
+#
+#   APPEARED   jobref is in this snapshot but was not in the previous one
+#   LAST_SEEN  jobref was in the previous snapshot (the id stored) ...
+#   REMOVED    ... and is gone from this one (the id stored)
+#
+# From the log we get first_seen/last_seen per jobref, time-on-market and
+# removals, which merge.py throws away.
+#
+# Usage:
+#   python snapshot_diff.py record "2024 CSVs/2024 Jan.csv" "2024 CSVs/2024 Apr 1.csv" ...
+#   python snapshot_diff.py diff "2024 CSVs/2024 Apr 1.csv" "2024 CSVs/2024 Apr 2.csv"
+#   python snapshot_diff.py report --out lifecycle.csv
+
+import argparse
+import csv
+import os
+import statistics
+import struct
+import time
+from array import array
+from datetime import date
+
+from corpus import parse_date, parse_jobref, read_rows
+
+LOG_FILE = "lifecycle.log"
+SNAPSHOTS_FILE = "lifecycle_snapshots.csv"
+LAST_FILE = "lifecycle_last.bin"
+
+APPEARED, LAST_SEEN, REMOVED = 1, 2, 3
+EVENT_NAMES = {APPEARED: "appeared", LAST_SEEN: "last_seen", REMOVED: "removed"}
+
+# jobref (uint32), event (uint8), snapshot id (uint16): 7 bytes per event
+EVENT = struct.Struct("<IBH")
+
+
+# ---------------- Snapshots ----------------
+def load_snapshot(path):
+    """
+    Read a crawl CSV. Returns (jobrefs, crawl_date): the sorted, de-duplicated
+    integer jobrefs and the latest opening date in the file, which is the best
+    estimate of when the crawl ran.
+    """
+    refs = set()
+    latest = None
+    for row in read_rows(path):
+        jobref = parse_jobref(row.get("jobref"))
+        if jobref is not None:
+            refs.add(jobref)
+        opened = parse_date(row.get("opening_date"))
+        if opened and (latest is None or opened > latest):
+            latest = opened
+    return array("I", sorted(refs)), latest
+
+
+def diff_sorted(prev, cur):
+    """
+    Sort-merge two ascending jobref arrays.
+    Returns (added, removed): jobrefs only in cur, jobrefs only in prev.
+    """
+    added, removed = array("I"), array("I")
+    i = j = 0
+    n_prev, n_cur = len(prev), len(cur)
+    while i < n_prev and j < n_cur:
+        a, b = prev[i], cur[j]
+        if a == b:
+            i += 1
+            j += 1
+        elif a < b:
+            removed.append(a)
+            i += 1
+        else:
+            added.append(b)
+            j += 1
+    removed.extend(prev[i:])
+    added.extend(cur[j:])
+    return added, removed
+
+
+# ---------------- Log ----------------
+def read_snapshots(path=SNAPSHOTS_FILE):
+    """Registered snapshots as a list of dicts, in snapshot id order."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def read_events(path=LOG_FILE):
+    """Yield (jobref, event, snapshot_id) for every logged event."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    # Ignore a torn trailing record from an interrupted append
+    usable = len(data) - len(data) % EVENT.size
+    yield from EVENT.iter_unpack(data[:usable])
+
+
+def record_snapshot(path, crawl_date=None, label=None,
+                    log_path=LOG_FILE, snapshots_path=SNAPSHOTS_FILE, last_path=LAST_FILE):
+    """
+    Diff a crawl against the previously recorded one and append the events.
+    Returns (snapshot_id, added, removed).
+    """
+    jobrefs, latest = load_snapshot(path)
+    crawl_date = crawl_date or latest
+    snapshots = read_snapshots(snapshots_path)
+    snap_id = len(snapshots)
+
+    prev = array("I")
+    if snapshots and os.path.exists(last_path):
+        with open(last_path, "rb") as f:
+            prev.frombytes(f.read())
+        prev_date = parse_iso(snapshots[-1]["crawl_date"])
+        if crawl_date and prev_date and crawl_date < prev_date:
+            print(f"WARNING: {path} ({crawl_date}) is older than the last recorded "
+                  f"snapshot ({prev_date}); record snapshots in crawl order")
+
+    added, removed = diff_sorted(prev, jobrefs)
+
+    events = bytearray()
+    for jobref in added:
+        events += EVENT.pack(jobref, APPEARED, snap_id)
+    for jobref in removed:
+        events += EVENT.pack(jobref, LAST_SEEN, snap_id - 1)
+        events += EVENT.pack(jobref, REMOVED, snap_id)
+    with open(log_path, "ab") as f:
+        f.write(events)
+
+    new_file = not os.path.exists(snapshots_path)
+    with open(snapshots_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["snapshot_id", "label", "path", "crawl_date", "jobrefs"])
+        writer.writerow([snap_id, label or os.path.splitext(os.path.basename(path))[0],
+                         path, crawl_date.isoformat() if crawl_date else "", len(jobrefs)])
+
+    tmp = last_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(jobrefs.tobytes())
+    os.replace(tmp, last_path)
+
+    return snap_id, added, removed
+
+
+def parse_iso(value):
+    return date.fromisoformat(value) if value else None
+
+
+def lifecycles(log_path=LOG_FILE, snapshots_path=SNAPSHOTS_FILE):
+    """
+    Replay the log into one record per jobref:
+    {jobref: [first_seen_id, last_seen_id, removed_id or None]}.
+    A jobref that is still listed has last_seen = the latest snapshot.
+    """
+    latest_id = len(read_snapshots(snapshots_path)) - 1
+    state = {}
+    for jobref, event, snap_id in read_events(log_path):
+        rec = state.get(jobref)
+        if event == APPEARED:
+            if rec is None:
+                state[jobref] = [snap_id, latest_id, None]
+            else:
+                # Relisted after a removal
+                rec[1], rec[2] = latest_id, None
+        elif event == LAST_SEEN and rec is not None:
+            rec[1] = snap_id
+        elif event == REMOVED and rec is not None:
+            rec[2] = snap_id
+    return state
+
+
+# ---------------- Main ----------------
+def report(out=None):
+    snapshots = read_snapshots()
+    if not snapshots:
+        print("No snapshots recorded yet.")
+        return
+    dates = [parse_iso(s["crawl_date"]) for s in snapshots]
+    state = lifecycles()
+
+    removed = {j: r for j, r in state.items() if r[2] is not None}
+    print(f"{len(snapshots)} snapshots, {len(state)} jobrefs tracked")
+    print(f"  still listed: {len(state) - len(removed)}")
+    print(f"  removed:      {len(removed)}")
+
+    # Time on market of removed vacancies, bounded by the crawls around them
+    days = [(dates[r[1]] - dates[r[0]]).days for r in removed.values()
+            if dates[r[0]] and dates[r[1]]]
+    if days:
+        print(f"  days on market (removed, first to last seen): "
+              f"median {statistics.median(days)}, mean {statistics.mean(days):.1f}, max {max(days)}")
+
+    if out:
+        with open(out, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(["jobref", "first_seen", "last_seen", "removed_in"])
+            for jobref in sorted(state):
+                first, last, gone = state[jobref]
+                writer.writerow([jobref, snapshots[first]["label"], snapshots[last]["label"],
+                                 snapshots[gone]["label"] if gone is not None else ""])
+        print(f"Saved lifecycle table to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track vacancy lifecycles across crawl snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="append snapshots (in crawl order) to the log")
+    rec.add_argument("csv", nargs="+")
+    rec.add_argument("--date", type=date.fromisoformat,
+                     help="crawl date, only with a single CSV (default: latest opening date in each file)")
+
+    d = sub.add_parser("diff", help="diff two snapshots without recording them")
+    d.add_argument("old")
+    d.add_argument("new")
+
+    rep = sub.add_parser("report", help="summarize the log")
+    rep.add_argument("--out", help="write a per-jobref lifecycle CSV")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        if args.date and len(args.csv) > 1:
+            parser.error("--date applies to one snapshot; record the files one at a time")
+        for path in args.csv:
+            snap_id, added, removed = record_snapshot(path, args.date)
+            print(f"Snapshot {snap_id} {path}: {len(added)} appeared, {len(removed)} removed")
+    elif args.command == "diff":
+        old, _ = load_snapshot(args.old)
+        new, _ = load_snapshot(args.new)
+        started = time.perf_counter()
+        added, removed = diff_sorted(old, new)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{len(old)} -> {len(new)} jobrefs: {len(added)} appeared, "
+              f"{len(removed)} removed ({elapsed:.2f} ms)")
+    else:
+        report(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# test_fetch_control.py
+#
+# FetchController against local servers: the simulate() checks (throttling,
+# variable latency without throttling), and the slot accounting on paths
+# that end without a normal response.
+#
+#   python -m pytest -q test_fetch_control.py
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch_control
+from fetch_control import FetchController, FetchError
+
+
+def test_simulate():
+    # Asserts on its own: every throttled fetch succeeds, and latency spread
+    # alone does not collapse the limit
+    fetch_control.simulate()
+
+
+class EdgeCaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/loop":
+            self.send_response(302)
+            self.send_header("Location", "/loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/forbidden":
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = "vacancy é".encode()
+        charset = "bogus-cs" if self.path == "/bogus" else "utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", f"text/html; charset={charset}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EdgeCaseHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_redirect_loop_releases_its_slot(base_url):
+    controller = FetchController(max_limit=2)
+    for _ in range(5):
+        with pytest.raises(FetchError):
+            controller.fetch(base_url + "/loop")
+    assert controller.host_state(base_url).in_flight == 0
+    assert controller.fetch(base_url + "/")[0] == 200
+
+
+def test_unknown_charset_decodes_as_utf8(base_url):
+    assert FetchController().fetch(base_url + "/bogus") == (200, "vacancy é")
+
+
+def test_refusal_does_not_cut_the_limit(base_url):
+    controller = FetchController(initial_limit=4)
+    for _ in range(5):
+        with pytest.raises(FetchError):
+            controller.fetch(base_url + "/forbidden")
+    assert controller.host_state(base_url).limit == 4
+
+
+def test_slow_success_closes_the_breaker(base_url):
+    controller = FetchController()
+    state = controller.host_state(base_url)
+    controller.fetch(base_url + "/")
+    # Breaker open long enough ago for a probe; the probe is slow but served
+    state.opened_at = time.monotonic() - fetch_control.COOLDOWN - 1
+    state.failures = fetch_control.FAILURE_THRESHOLD
+    state.acquire(0)
+    assert state.probing
+    state.release(state.best_latency * 10, ok=True, throttled=False)
+    assert state.opened_at is None
+    assert state.failures == 0
+
+
+def test_max_limit_caps_the_host(base_url):
+    controller = FetchController(max_limit=3)
+    for _ in range(20):
+        controller.fetch(base_url + "/")
+    assert controller.host_state(base_url).limit == 3
@@ -0,0 +1,190 @@
+# test_work_queue.py
+#
+# The lease protocol of work_queue.py, end to end: worker processes claim
+# tasks against a local stand-in for Wayback, one of them is killed while
+# holding a lease, and the others must pick its task up once the lease
+# expires. The claim/complete/fail rules are also checked directly.
+#
+#   python -m pytest -q test_work_queue.py
+
+import csv
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import work_queue
+from fetch_control import FetchController
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TIMESTAMPS = ["20250101000000", "20250201000000"]
+NOT_ARCHIVED = "20250301000000"     # served as an error page without a job table
+PAGES = 4                   # pages 1-3 hold rows, page 4 is past the end
+ROWS_PER_PAGE = 25
+
+
+def listing_html(page):
+    """A listing page in the current site's table layout (no table past the last page)."""
+    if page >= PAGES:
+        return "<html><body>No vacancies</body></html>"
+    rows = ["<tr><th>#</th><th>Job Ref No</th><th>Position and Employer</th></tr>"]
+    for i in range(1, ROWS_PER_PAGE + 1):
+        jobref = 1_400_000 - page * 100 - i
+        rows.append(
+            f"<tr><td>{i}</td><td>{jobref}</td>"
+            f"<td><h2><span>Position {jobref}</span></h2><h1>Company {i % 7}</h1></td>"
+            f"<td>Please refer the vacancy</td><td>Mon Dec 01 2025</td><td>Mon Dec 15 2025</td>"
+            f"<td>Colombo</td></tr>"
+        )
+    return f"<html><body><div id='jb-list'><table>{''.join(rows)}</table></div></body></html>"
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """/<timestamp>/<page>; holds every response while `hold` is cleared."""
+
+    protocol_version = "HTTP/1.1"
+    hold = threading.Event()
+
+    def do_GET(self):
+        self.hold.wait(60)
+        _, timestamp, page = self.path.split("/")
+        if timestamp == NOT_ARCHIVED:
+            body = b"<html><body>Wayback Machine has not archived that URL.</body></html>"
+        else:
+            body = listing_html(int(page)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ListingHandler.hold.set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ListingHandler)
+    httpd.daemon_threads = True
+    # The killed worker's connection breaks mid-response; that is expected
+    httpd.handle_error = lambda request, client_address: None
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/{{timestamp}}/{{page}}"
+    ListingHandler.hold.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def start_worker(tmp_path, url_template, threads=2, lease=2):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "work_queue.py"), "--db", "queue.sqlite",
+         "work", "--threads", str(threads), "--url-template", url_template,
+         "--lease", str(lease), "--idle-exit", "3"],
+        cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_for(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_workers_take_over_a_crashed_lease(tmp_path, server, monkeypatch):
+    # Result paths are relative to the workers' directory, as in real use
+    monkeypatch.chdir(tmp_path)
+    conn = work_queue.open_queue(str(tmp_path / "queue.sqlite"))
+    assert work_queue.enqueue(conn, work_queue.wayback_tasks(TIMESTAMPS, range(1, PAGES + 1))) == 8
+
+    # A worker claims a task, then dies while the fetch is still hanging
+    ListingHandler.hold.clear()
+    crashed = start_worker(tmp_path, server, threads=1)
+    leased = lambda: conn.execute(
+        "SELECT key, owner FROM tasks WHERE state = 'leased'").fetchone()
+    assert wait_for(leased)
+    crashed_key, crashed_owner = leased()
+    crashed.kill()
+    crashed.wait()
+    ListingHandler.hold.set()
+
+    workers = [start_worker(tmp_path, server) for _ in range(3)]
+    for w in workers:
+        assert w.wait(timeout=60) == 0
+
+    assert work_queue.queue_status(conn) == {"done": 8}
+    attempts, = conn.execute("SELECT attempts FROM tasks WHERE key = ?", (crashed_key,)).fetchone()
+    assert attempts == 2
+    winner, = conn.execute("SELECT worker FROM results WHERE key = ?", (crashed_key,)).fetchone()
+    assert winner != crashed_owner
+    assert conn.execute("SELECT COUNT(*) FROM results").fetchone() == (8,)
+
+    # Both snapshots list the same 75 jobrefs; collect keeps each once
+    out = tmp_path / "backfill.csv"
+    assert work_queue.collect(conn, str(out)) == (PAGES - 1) * ROWS_PER_PAGE
+    with open(out, newline="", encoding="utf-8-sig") as f:
+        jobrefs = [row["jobref"] for row in csv.DictReader(f)]
+    assert len(set(jobrefs)) == len(jobrefs)
+    conn.close()
+
+
+def test_complete_twice_keeps_the_first_result(tmp_path):
+    conn = work_queue.open_queue(str(tmp_path / "queue.sqlite"))
+    work_queue.enqueue(conn, [("t1", {"timestamp": TIMESTAMPS[0], "page": 1})])
+
+    # worker-a's lease expires mid-task and worker-b takes the task over
+    assert work_queue.claim(conn, "worker-a", lease=-1)[0] == "t1"
+    assert work_queue.claim(conn, "worker-b")[0] == "t1"
+    assert work_queue.complete(conn, "t1", "worker-b", 25, "b.csv") is True
+    assert work_queue.complete(conn, "t1", "worker-a", 25, "a.csv") is False
+
+    assert conn.execute("SELECT worker, output FROM results").fetchall() == [("worker-b", "b.csv")]
+    assert work_queue.queue_status(conn) == {"done": 1}
+    conn.close()
+
+
+def test_expired_lease_is_not_reclaimed_past_max_attempts(tmp_path):
+    conn = work_queue.open_queue(str(tmp_path / "queue.sqlite"))
+    work_queue.enqueue(conn, [("t1", {"timestamp": TIMESTAMPS[0], "page": 1})])
+
+    for i in range(3):
+        assert work_queue.claim(conn, f"crashing-{i}", lease=-1, max_attempts=3) is not None
+    assert work_queue.claim(conn, "worker", max_attempts=3) is None
+    state, last_error = conn.execute("SELECT state, last_error FROM tasks").fetchone()
+    assert state == "failed"
+    assert "lease expired" in last_error
+    conn.close()
+
+
+def test_failed_task_is_retried_until_max_attempts(tmp_path):
+    conn = work_queue.open_queue(str(tmp_path / "queue.sqlite"))
+    work_queue.enqueue(conn, [("t1", {"timestamp": TIMESTAMPS[0], "page": 1})])
+
+    for _ in range(2):
+        work_queue.claim(conn, "worker")
+        work_queue.fail(conn, "t1", "worker", "HTTP 503", max_attempts=2)
+    assert work_queue.queue_status(conn) == {"failed": 1}
+    conn.close()
+
+
+def test_page_one_without_a_table_fails_instead_of_completing(tmp_path, server, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / "queue.sqlite")
+    conn = work_queue.open_queue(db)
+    work_queue.enqueue(conn, work_queue.wayback_tasks([NOT_ARCHIVED], [1, PAGES]))
+
+    work_queue.worker_loop(db, "worker", FetchController(), url_template=server, idle_exit=0)
+
+    states = dict(conn.execute("SELECT key, state FROM tasks").fetchall())
+    assert states == {f"wayback-{NOT_ARCHIVED}-p001": "failed",     # retried, then given up
+                      f"wayback-{NOT_ARCHIVED}-p{PAGES:03d}": "done"}  # past the end: empty result
+    attempts, = conn.execute("SELECT MAX(attempts) FROM tasks").fetchone()
+    assert attempts == work_queue.MAX_ATTEMPTS
+    conn.close()
@@ -0,0 +1,268 @@
+# warehouse.py
+#
+# One SQLite table holding every listing ever scraped, keyed by jobref.
+# Scrapers and merge.py upsert their rows in batches instead of rewriting a
+# *_merged.csv, so adding a day's rows costs time proportional to those rows;
+# CSVs are exported from here when a file is needed.
+#
+# Dates are kept as shown on the site ("Mon Dec 01 2025") for export, plus
+# ISO copies (opened, closes) that the date indexes and range queries use.
+# A jobref seen again takes the newer row's fields; first_seen/last_seen keep
+# when it was first and last scraped. A CSV carries no scrape time, so loading
+# one uses its latest opening date (else its modification time), and an old
+# file re-loaded later does not overwrite newer rows.
+#
+# Usage:
+#   python warehouse.py load                          # every file in CORPUS_FILES
+#   python warehouse.py load topjobs_titles_all_pages_with_rowtypes.csv
+#   python warehouse.py load --seen 2025-12-01T09:30 daily.csv
+#   python warehouse.py find --company "MAS Intimates" --since 2025-01-01
+#   python warehouse.py find --jobref 1436596
+#   python warehouse.py export --since 2025-01-01 --until 2025-12-31 --out 2025_export.csv
+
+import argparse
+import csv
+import os
+import sqlite3
+from datetime import datetime
+
+from corpus import COLUMNS, CORPUS_FILES, parse_date, parse_jobref, read_rows
+
+WAREHOUSE_DB = "warehouse.sqlite"
+
+# Listing fields besides jobref, in CSV column order
+FIELDS = [c for c in COLUMNS if c != "jobref"]
+INT_FIELDS = ("page", "row_no")
+
+UPSERT_BATCH = 5000
+LOOKUP_CHUNK = 500          # jobrefs per IN (...) when reading the stored rows of a batch
+
+
+def open_db(path=WAREHOUSE_DB):
+    # Crawl daemon threads and work_queue processes upsert concurrently
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS listings (
+            jobref          INTEGER PRIMARY KEY,
+            page            INTEGER,
+            row_no          INTEGER,
+            position        TEXT NOT NULL DEFAULT '',
+            company         TEXT NOT NULL DEFAULT '',
+            jobdesc_snippet TEXT NOT NULL DEFAULT '',
+            opening_date    TEXT NOT NULL DEFAULT '',
+            closing_date    TEXT NOT NULL DEFAULT '',
+            town            TEXT NOT NULL DEFAULT '',
+            row_type        TEXT NOT NULL DEFAULT '',
+            opened          TEXT,
+            closes          TEXT,
+            source          TEXT,
+            first_seen      TEXT NOT NULL,
+            last_seen       TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS listings_opened ON listings (opened);
+        CREATE INDEX IF NOT EXISTS listings_closes ON listings (closes);
+        CREATE INDEX IF NOT EXISTS listings_company ON listings (company COLLATE NOCASE, opened);
+        CREATE INDEX IF NOT EXISTS listings_town ON listings (town COLLATE NOCASE, opened);
+        """
+    )
+    return conn
+
+
+def _text(value):
+    # pandas hands missing values over as NaN, RowBuffer as None
+    if isinstance(value, str):
+        return value.strip()
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value)
+
+
+def _int(value):
+    if isinstance(value, float) and value == value:
+        return int(value)
+    return parse_jobref(value)
+
+
+def _iso(value):
+    parsed = parse_date(value) if value else None
+    return parsed.isoformat() if parsed else None
+
+
+# Insert, or replace the fields of an existing jobref unless the stored row
+# was seen later than this one (re-loading an old CSV must not roll back a
+# newer scrape)
+_NEWER = "excluded.last_seen >= listings.last_seen"
+UPSERT_SQL = (
+    "INSERT INTO listings (jobref, {cols}, opened, closes, source, first_seen, last_seen) "
+    "VALUES (?, {marks}, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (jobref) DO UPDATE SET {updates}, "
+    "first_seen = MIN(listings.first_seen, excluded.first_seen), "
+    "last_seen = MAX(listings.last_seen, excluded.last_seen)"
+).format(
+    cols=", ".join(FIELDS),
+    marks=", ".join("?" for _ in FIELDS),
+    updates=", ".join(f"{c} = CASE WHEN {_NEWER} THEN excluded.{c} ELSE listings.{c} END"
+                      for c in FIELDS + ["opened", "closes", "source"]),
+)
+
+
+def _existing(conn, jobrefs):
+    """{jobref: (field values..., last_seen)} for the jobrefs already stored (primary-key lookups only)."""
+    found = {}
+    for i in range(0, len(jobrefs), LOOKUP_CHUNK):
+        chunk = jobrefs[i:i + LOOKUP_CHUNK]
+        sql = (f"SELECT jobref, {', '.join(FIELDS)}, last_seen FROM listings "
+               f"WHERE jobref IN ({', '.join('?' for _ in chunk)})")
+        found.update((row[0], row[1:]) for row in conn.execute(sql, chunk))
+    return found
+
+
+def upsert_rows(conn, rows, source=None, seen=None):
+    """
+    Insert or update rows by jobref, one transaction per batch. Rows can come
+    from scrape_current_page (RowBuffer), a CSV or df.to_dict("records").
+    `seen` is when the rows were scraped (default: now).
+    Returns (new, updated) row counts; `updated` counts stored listings
+    whose fields this call changed.
+    """
+    seen = seen or datetime.now().isoformat(timespec="seconds")
+    new = updated = 0
+    batch = {}
+    done = set()
+
+    def flush():
+        nonlocal new, updated
+        existing = _existing(conn, list(batch))
+        with conn:
+            conn.executemany(UPSERT_SQL, batch.values())
+        new += len(batch) - len(existing)
+        for jobref, stored in existing.items():
+            *fields, last_seen = stored
+            if seen >= last_seen and tuple(fields) != batch[jobref][1:len(FIELDS) + 1]:
+                updated += 1
+        done.update(batch)
+        batch.clear()
+
+    for row in rows:
+        jobref = _int(row.get("jobref"))
+        # The first row of a jobref wins, as in the de-duplicated CSVs the
+        # scrapers write (featured listings repeat further down the pages)
+        if jobref is None or jobref in batch or jobref in done:
+            continue
+        values = [_int(row.get(c)) if c in INT_FIELDS else _text(row.get(c)) for c in FIELDS]
+        opened, closes = _iso(row.get("opening_date")), _iso(row.get("closing_date"))
+        batch[jobref] = (jobref, *values, opened, closes, source, seen, seen)
+        if len(batch) >= UPSERT_BATCH:
+            flush()
+    if batch:
+        flush()
+    return new, updated
+
+
+def rows_seen(rows):
+    """Start of the latest opening date among rows (ISO), a lower bound on when they were scraped; None if no date parses."""
+    latest = max(filter(None, (_iso(row.get("opening_date")) for row in rows)), default=None)
+    return f"{latest}T00:00:00" if latest else None
+
+
+def csv_seen(path):
+    """When a CSV was scraped: rows_seen of its rows, else the file's modification time."""
+    return rows_seen(read_rows(path)) or datetime.fromtimestamp(
+        os.path.getmtime(path)).isoformat(timespec="seconds")
+
+
+def load_csv(conn, path, seen=None):
+    """Upsert a scraper/merge CSV; `seen` defaults to csv_seen(path)."""
+    return upsert_rows(conn, read_rows(path), source=path, seen=seen or csv_seen(path))
+
+
+# ---------------- Queries ----------------
+def find(conn, jobref=None, company=None, town=None, since=None, until=None, limit=50):
+    """
+    Listings matching every given filter, newest opening date first. since /
+    until are ISO dates ("2025-01-01") on the opening date. Each filter is
+    served by an index (jobref is the primary key).
+    """
+    sql = f"SELECT jobref, {', '.join(FIELDS)} FROM listings WHERE 1 = 1"
+    params = []
+    if jobref is not None:
+        sql += " AND jobref = ?"
+        params.append(jobref)
+    if company:
+        sql += " AND company = ? COLLATE NOCASE"
+        params.append(company)
+    if town:
+        sql += " AND town = ? COLLATE NOCASE"
+        params.append(town)
+    if since:
+        sql += " AND opened >= ?"
+        params.append(since)
+    if until:
+        sql += " AND opened <= ?"
+        params.append(until)
+    sql += " ORDER BY opened DESC, jobref DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cur = conn.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur]
+
+
+def export_csv(conn, out, since=None, until=None):
+    """Write listings (optionally an opening-date range) as a scraper-format CSV. Returns the row count."""
+    rows = find(conn, since=since, until=until, limit=None)
+    with open(out, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({c: "" if row[c] is None else row[c] for c in COLUMNS})
+    return len(rows)
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="SQLite listing warehouse keyed by jobref.")
+    parser.add_argument("--db", default=WAREHOUSE_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    load = sub.add_parser("load", help="upsert rows from CSVs")
+    load.add_argument("csv", nargs="*", help="default: every file in CORPUS_FILES, oldest first")
+    load.add_argument("--seen", help="scrape time of the rows, ISO (default: each file's latest opening date)")
+
+    for name, help_text in (("find", "look up listings"), ("export", "write listings to a CSV")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--since", help="opening date, YYYY-MM-DD")
+        p.add_argument("--until", help="opening date, YYYY-MM-DD")
+        if name == "find":
+            p.add_argument("--jobref", type=int)
+            p.add_argument("--company")
+            p.add_argument("--town")
+            p.add_argument("-n", type=int, default=20)
+        else:
+            p.add_argument("--out", default="warehouse_export.csv")
+
+    args = parser.parse_args()
+    conn = open_db(args.db)
+    try:
+        if args.command == "load":
+            paths = args.csv or [path for _, path in CORPUS_FILES]
+            for path in paths:
+                new, updated = load_csv(conn, path, args.seen)
+                print(f"{path}: {new} new, {updated} updated")
+        elif args.command == "find":
+            for row in find(conn, args.jobref, args.company, args.town, args.since, args.until, args.n):
+                print(f"  {row['jobref']:>8}  {row['opening_date']:<16} {row['company'][:30]:<30} "
+                      f"{row['position'][:40]:<40} {row['town']}")
+        else:
+            written = export_csv(conn, args.out, args.since, args.until)
+            print(f"Saved {written} rows to {args.out}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
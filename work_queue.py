@@ -0,0 +1,353 @@
+# work_queue.py
+#
+# Sharded Wayback backfills. The coordinator splits a backfill into one task
+# per (timestamp, pageNo) and stores them in a SQLite queue; any number of
+# worker processes, on this machine or on others sharing the same storage,
+# claim tasks under a time-limited lease:
+#
+#   pending --claim--> leased --complete--> done
+#                        |  \--fail-----> pending (retry) / failed
+#                        \--lease expires (worker crashed)--> claimable again,
+#                                                             failed after MAX_ATTEMPTS
+#
+# Results are committed idempotently by task key: each task writes its rows
+# to OUT_DIR/<key>.csv (atomic rename) and records one row in `results`, so a
+# task finished twice after a lease expiry leaves a single result.
+#
+# Note: WAL mode needs shared memory between processes, which network
+# filesystems do not provide. For workers on several nodes use --no-wal.
+#
+# Usage:
+#   python work_queue.py enqueue --timestamps 20220520233919 20230326214532 --pages 1-40
+#   python work_queue.py work --threads 4          # run in as many processes/nodes as you like
+#   python work_queue.py status
+#   python work_queue.py collect --out wayback_backfill.csv
+
+import argparse
+import csv
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import warehouse
+from fetch_control import CircuitOpenError, FetchController, FetchError
+from listing_parse import parse_validated
+from listing_urls import WAYBACK_URL, wayback_time
+from parse_cache import ParseCache
+from page_validation import ExtractionError, MissingTableError
+from row_buffer import COLUMNS
+
+QUEUE_DB = "work_queue.sqlite"
+OUT_DIR = "backfill_output"
+
+LEASE_SECONDS = 600         # a worker that has not finished by then is presumed dead
+MAX_ATTEMPTS = 5
+IDLE_EXIT = 30              # a worker exits after this long with nothing to claim
+
+
+def open_queue(path=QUEUE_DB, wal=True):
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 60000")
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            key           TEXT PRIMARY KEY,
+            payload       TEXT NOT NULL,
+            state         TEXT NOT NULL DEFAULT 'pending',
+            owner         TEXT,
+            lease_expires REAL,
+            attempts      INTEGER NOT NULL DEFAULT 0,
+            last_error    TEXT,
+            updated       REAL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_claimable ON tasks (state, lease_expires);
+        CREATE TABLE IF NOT EXISTS results (
+            key          TEXT PRIMARY KEY,
+            worker       TEXT NOT NULL,
+            rows         INTEGER NOT NULL,
+            output       TEXT,
+            committed_at REAL NOT NULL
+        );
+        """
+    )
+    return conn
+
+
+# ---------------- Coordinator ----------------
+def enqueue(conn, tasks):
+    """Add tasks as (key, payload dict). Existing keys are left alone. Returns the number added."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    before = conn.total_changes
+    conn.executemany(
+        "INSERT OR IGNORE INTO tasks (key, payload, updated) VALUES (?, ?, ?)",
+        [(key, json.dumps(payload), now) for key, payload in tasks],
+    )
+    added = conn.total_changes - before
+    conn.execute("COMMIT")
+    return added
+
+
+def wayback_tasks(timestamps, pages):
+    for ts in timestamps:
+        for page in pages:
+            yield f"wayback-{ts}-p{page:03d}", {"timestamp": ts, "page": page}
+
+
+def queue_status(conn):
+    return dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+
+# ---------------- Worker side ----------------
+def claim(conn, worker, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """
+    Lease one claimable task: pending, or leased with an expired lease and
+    attempts to spare. Expired tasks without any left (a page that crashes
+    every worker that takes it) are marked failed. Returns (key, payload) or None.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE tasks SET state = 'failed', owner = NULL, lease_expires = NULL, "
+            "last_error = 'lease expired on every attempt', updated = ? "
+            "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, max_attempts),
+        )
+        row = conn.execute(
+            "SELECT key, payload FROM tasks "
+            "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ? AND attempts < ?) "
+            "ORDER BY key LIMIT 1",
+            (now, max_attempts),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, "
+            "attempts = attempts + 1, updated = ? WHERE key = ?",
+            (worker, now + lease, now, row[0]),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row[0], json.loads(row[1])
+
+
+def complete(conn, key, worker, rows, output):
+    """
+    Commit a task's result. Idempotent: if another worker already committed
+    this key (after our lease expired), the first result stands.
+    Returns True if this call recorded the result.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO results (key, worker, rows, output, committed_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (key, worker, rows, output, now),
+    )
+    recorded = cur.rowcount == 1
+    conn.execute(
+        "UPDATE tasks SET state = 'done', owner = ?, lease_expires = NULL, updated = ? WHERE key = ?",
+        (worker, now, key),
+    )
+    conn.execute("COMMIT")
+    return recorded
+
+
+def fail(conn, key, worker, error, max_attempts=MAX_ATTEMPTS):
+    """Give a task back for retry, or mark it failed after max_attempts."""
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "owner = NULL, lease_expires = NULL, last_error = ?, updated = ? "
+        "WHERE key = ? AND owner = ? AND state = 'leased'",
+        (max_attempts, error, time.time(), key, worker),
+    )
+    conn.execute("COMMIT")
+
+
+def write_rows(path, rows):
+    """Write a task's rows; the rename makes a re-run replace rather than append."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in COLUMNS])
+    os.replace(tmp, path)
+
+
+def run_task(controller, payload, url_template=WAYBACK_URL, cache=None):
+    """
+    Fetch and parse one listing page. Returns a RowBuffer (empty past the
+    last page); raises ExtractionError if its rows fail validation, or
+    MissingTableError if page 1 has no job table.
+    """
+    status, html = controller.fetch(url_template.format(**payload))
+    if status != 200:
+        return None
+    rows, _ = parse_validated(html, payload["page"], cache=cache)
+    return rows
+
+
+def worker_loop(db_path, worker, controller, out_dir=OUT_DIR, url_template=WAYBACK_URL,
+                wal=True, lease=LEASE_SECONDS, idle_exit=IDLE_EXIT, cache=None):
+    """Claim and process tasks until the queue stays empty for idle_exit seconds."""
+    conn = open_queue(db_path, wal)
+    wh_conn = warehouse.open_db()
+    os.makedirs(out_dir, exist_ok=True)
+    done = 0
+    idle_since = None
+    try:
+        while True:
+            task = claim(conn, worker, lease)
+            if task is None:
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since > idle_exit:
+                    return done
+                time.sleep(1.0)
+                continue
+            idle_since = None
+
+            key, payload = task
+            try:
+                rows = run_task(controller, payload, url_template, cache)
+            except (FetchError, CircuitOpenError, MissingTableError, OSError) as e:
+                # A page 1 without a table is an error page, not an empty
+                # listing: retry it rather than record 0 rows
+                print(f"[{worker}] {key}: {e}")
+                fail(conn, key, worker, str(e))
+                continue
+            except ExtractionError as e:
+                # Same HTML, same result: retrying will not help
+                print(f"[{worker}] {key}: {e}")
+                fail(conn, key, worker, str(e), max_attempts=0)
+                continue
+            except Exception as e:
+                print(f"[{worker}] {key}: parse error {e!r}")
+                fail(conn, key, worker, repr(e))
+                continue
+
+            n = len(rows) if rows else 0
+            output = None
+            if n:
+                output = os.path.join(out_dir, f"{key}.csv")
+                write_rows(output, rows)
+                # Upserts by jobref are idempotent too, so a re-run task changes nothing
+                warehouse.upsert_rows(wh_conn, rows, source=key, seen=wayback_time(payload["timestamp"]))
+            if complete(conn, key, worker, n, output):
+                done += 1
+                print(f"[{worker}] {key}: {n} rows")
+    finally:
+        conn.close()
+        wh_conn.close()
+
+
+def work(db_path, threads, out_dir, url_template, wal, lease, idle_exit):
+    worker_base = f"{socket.gethostname()}-{os.getpid()}"
+    # One controller per process so all threads share per-host limits
+    controller = FetchController()
+    # Snapshots that repeat an already-parsed page skip the parse
+    cache = ParseCache()
+    results = [0] * threads
+
+    def run(i):
+        results[i] = worker_loop(db_path, f"{worker_base}-{i}", controller, out_dir, url_template,
+                                 wal, lease, idle_exit, cache)
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    print(f"Worker {worker_base}: {sum(results)} tasks committed")
+
+
+def collect(conn, out):
+    """Concatenate every committed result into one CSV, de-duplicated by jobref."""
+    seen = set()
+    written = 0
+    with open(out, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for (path,) in conn.execute("SELECT output FROM results WHERE output IS NOT NULL ORDER BY key"):
+            with open(path, newline="", encoding="utf-8-sig") as src:
+                for row in csv.DictReader(src):
+                    if row["jobref"] in seen:
+                        continue
+                    seen.add(row["jobref"])
+                    writer.writerow([row[c] for c in COLUMNS])
+                    written += 1
+    return written
+
+
+def parse_pages(spec):
+    """"1-40" or "1,2,5" -> list of page numbers."""
+    pages = []
+    for part in spec.split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            pages.extend(range(int(lo), int(hi) + 1))
+        else:
+            pages.append(int(part))
+    return pages
+
+
+# ---------------- Main ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Leased work queue for Wayback backfills.")
+    parser.add_argument("--db", default=QUEUE_DB)
+    parser.add_argument("--no-wal", action="store_true", help="rollback journal (network filesystems)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enq = sub.add_parser("enqueue", help="add timestamp x pageNo tasks")
+    enq.add_argument("--timestamps", nargs="+", required=True)
+    enq.add_argument("--pages", default="1-40")
+
+    w = sub.add_parser("work", help="claim and run tasks")
+    w.add_argument("--threads", type=int, default=1)
+    w.add_argument("--out-dir", default=OUT_DIR)
+    w.add_argument("--url-template", default=WAYBACK_URL,
+                   help="page URL with {timestamp} and {page} placeholders")
+    w.add_argument("--lease", type=float, default=LEASE_SECONDS, help="seconds before a claimed task is reclaimable")
+    w.add_argument("--idle-exit", type=float, default=IDLE_EXIT, help="exit after this many idle seconds")
+
+    sub.add_parser("status", help="task counts by state")
+
+    col = sub.add_parser("collect", help="combine committed results into one CSV")
+    col.add_argument("--out", default="wayback_backfill.csv")
+
+    args = parser.parse_args()
+    wal = not args.no_wal
+
+    if args.command == "work":
+        work(args.db, args.threads, args.out_dir, args.url_template, wal, args.lease, args.idle_exit)
+        return
+
+    conn = open_queue(args.db, wal)
+    try:
+        if args.command == "enqueue":
+            added = enqueue(conn, wayback_tasks(args.timestamps, parse_pages(args.pages)))
+            print(f"Enqueued {added} new tasks; queue: {queue_status(conn)}")
+        elif args.command == "status":
+            print(queue_status(conn))
+            for key, error in conn.execute(
+                    "SELECT key, last_error FROM tasks WHERE state = 'failed' ORDER BY key LIMIT 20"):
+                print(f"  failed {key}: {error}")
+        else:
+            written = collect(conn, args.out)
+            print(f"Saved {written} unique rows to {args.out}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()